@@ -0,0 +1,169 @@
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+# Upper bounds of the request duration histogram buckets, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Stage record fields that are not metric labels: the measurements, and the number of clusters
+# of the search stages, which would create a series per candidate k
+UNLABELLED_FIELDS = ("seconds", "rows", "bytes_allocated", "k")
+
+# Source files whose frames mark a thread as idle in profiles
+IDLE_MODULES = ("threading.py", "selectors.py", "queue.py", "thread.py")
+
+# Stages being timed in each thread, innermost last, as [traced bytes at start, peak of inner stages]
+_open_stages = threading.local()
+
+
+class StageTimings:
+    """Wall time, rows processed and bytes allocated by each stage of one operation.
+
+    Bytes are the peak memory traced during the stage and are only measured while tracemalloc is
+    tracing (see TRACE_ALLOCATIONS), since tracing slows down every allocation. Other threads
+    allocating at the same time are counted too.
+    """
+
+    def __init__(self):
+        self.records: List[Dict[str, Any]] = []
+
+    @contextmanager
+    def stage(self, name: str, rows: Optional[int] = None, **labels) -> Iterator[Dict[str, Any]]:
+        """Time the enclosed block as one stage. Yields the record, so rows can be set inside."""
+        record = {"stage": name, **labels, "seconds": None, "rows": rows, "bytes_allocated": None}
+        self.records.append(record)
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            stack = _open_stages.__dict__.setdefault("stack", [])
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            stack.append([current, 0])
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["seconds"] = round(time.perf_counter() - start, 6)
+            if tracing:
+                # Nested stages reset the peak, so fold their peaks into the enclosing stage
+                start_bytes, inner_peak = stack.pop()
+                peak = max(tracemalloc.get_traced_memory()[1], inner_peak)
+                if stack:
+                    stack[-1][1] = max(stack[-1][1], peak)
+                record["bytes_allocated"] = max(peak - start_bytes, 0)
+
+    def extend(self, records: List[Dict[str, Any]]):
+        """Add stages timed elsewhere, e.g. in a worker process."""
+        self.records.extend(records)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Tuple[Tuple[str, Any], ...]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}" if labels else ""
+
+
+class Metrics:
+    """Process-wide counters of segmentation stages and HTTP requests, in Prometheus text format.
+
+    Each worker process keeps its own metrics; Prometheus aggregates them across workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[Tuple, List[float]] = defaultdict(lambda: [0, 0.0, 0, 0])
+        self._requests: Dict[Tuple, List[float]] = defaultdict(lambda: [0] * (len(REQUEST_BUCKETS) + 2))
+
+    def record_stages(self, records: List[Dict[str, Any]]):
+        """Count the stages of one operation."""
+        with self._lock:
+            for record in records:
+                labels = tuple((key, value) for key, value in record.items() if key not in UNLABELLED_FIELDS)
+                totals = self._stages[labels]
+                totals[0] += 1
+                totals[1] += record["seconds"] or 0.0
+                totals[2] += record["rows"] or 0
+                totals[3] += record["bytes_allocated"] or 0
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        """Count one HTTP request in the duration histogram of its route."""
+        with self._lock:
+            counts = self._requests[(("method", method), ("route", route), ("status", status))]
+            for i, bound in enumerate(REQUEST_BUCKETS):
+                if seconds <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += seconds
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            stage_metrics = [
+                ("segmentation_stage_runs_total", "Number of times each segmentation stage ran.", 0),
+                ("segmentation_stage_seconds_total", "Time spent in each segmentation stage.", 1),
+                ("segmentation_stage_rows_total", "Rows processed by each segmentation stage.", 2),
+                ("segmentation_stage_bytes_allocated_total",
+                 "Peak bytes allocated by each segmentation stage, when allocation tracing is on.", 3),
+            ]
+            for name, help_text, i in stage_metrics:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, totals in self._stages.items():
+                    lines.append(f"{name}{_format_labels(labels)} {totals[i]}")
+
+            name = "http_request_duration_seconds"
+            lines.append(f"# HELP {name} Duration of HTTP requests until the response starts.")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, counts in self._requests.items():
+                for bound, count in zip(REQUEST_BUCKETS + ("+Inf",), counts[:-1]):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {counts[-1]}")
+                lines.append(f"{name}_count{_format_labels(labels)} {counts[-2]}")
+        return "\n".join(lines) + "\n"
+
+
+class SamplingProfiler:
+    """Samples the call stacks of all threads at a fixed interval while running.
+
+    Meant for profiling a single request, including the threads doing its work, with little
+    overhead. The result is in collapsed-stack format, one "frame;frame;... count" line per
+    distinct stack, as read by flame graph tools. Idle threads are left out.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.counts: Dict[str, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_filename.endswith(IDLE_MODULES):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.counts[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in
+                       sorted(self.counts.items(), key=lambda item: -item[1]))
@@ -0,0 +1,143 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from app.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Callback used by a job to report its progress: stage name plus details
+ProgressCallback = Callable[..., None]
+
+
+@dataclass
+class Job:
+    """A unit of background work and its current state."""
+    id: str
+    key: str
+    status: str = "queued"
+    progress: Dict[str, Any] = field(default_factory=dict)
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    future: Future = field(default_factory=Future, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> "Job":
+        """A job as saved by another worker process; its result and future stay in that process."""
+        return cls(id=state["job_id"], key=state["key"], status=state["status"], progress=state["progress"],
+                   error=state["error"], created_at=state["created_at"], finished_at=state["finished_at"])
+
+
+class JobManager:
+    """Runs jobs in background threads, collapsing identical concurrent submissions into one run.
+
+    With a state_dir, the state of each job is also saved there as <job id>.json whenever it
+    changes, so worker processes sharing the directory can report on each other's jobs.
+    """
+
+    def __init__(self, max_workers: int = 1, max_finished: int = 100, state_dir: Optional[Path] = None):
+        self.max_finished = max_finished
+        self.state_dir = Path(state_dir) if state_dir is not None else None
+        if self.state_dir is not None:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key: str, fn: Callable[[ProgressCallback], Any]) -> Job:
+        """Start fn in the background, or return the queued or running job with the same key.
+
+        fn is called with a progress callback that takes a stage name and keyword details.
+        """
+        with self._lock:
+            job = self._active.get(key)
+            if job is not None:
+                return job
+
+            job = Job(id=uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            self._prune()
+
+        self._save(job)
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Return a job of this process, or one saved by another worker process without its result."""
+        job = self._jobs.get(job_id)
+        if job is not None or self.state_dir is None or not job_id.isalnum():
+            return job
+        try:
+            with open(self.state_dir / f"{job_id}.json") as f:
+                return Job.from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    def _run(self, job: Job, fn: Callable[[ProgressCallback], Any]):
+        def report(stage: str, **details):
+            job.progress = {"stage": stage, **details}
+            self._save(job)
+
+        job.status = "running"
+        self._save(job)
+        try:
+            job.result = fn(report)
+            job.status = "completed"
+            job.future.set_result(job.result)
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = "failed"
+            job.future.set_exception(e)
+        finally:
+            job.finished_at = time.time()
+            self._save(job)
+            with self._lock:
+                self._active.pop(job.key, None)
+
+    def _save(self, job: Job):
+        """Write the state of a job for the other worker processes, replacing it atomically."""
+        if self.state_dir is None:
+            return
+        path = self.state_dir / f"{job.id}.json"
+        tmp = path.with_name(f"{job.id}.{uuid.uuid4().hex}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                f.write(dumps({**job.to_dict(), "key": job.key}))
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Could not save state of job {job.id}: {str(e)}")
+            tmp.unlink(missing_ok=True)
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond max_finished."""
+        finished = [job for job in self._jobs.values() if job.done]
+        for job in sorted(finished, key=lambda j: j.created_at)[:-self.max_finished or None]:
+            del self._jobs[job.id]
+            if self.state_dir is not None:
+                (self.state_dir / f"{job.id}.json").unlink(missing_ok=True)
@@ -0,0 +1,41 @@
+from pathlib import Path
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, where only threads are serialized
+    fcntl = None
+
+
+class FileLock:
+    """Exclusive lock shared by the threads of this process and by other worker processes.
+
+    Uses flock(2) on the given file, so uvicorn workers on the same host coordinate through the
+    filesystem. The lock is not reentrant.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self) -> "FileLock":
+        self._thread_lock.acquire()
+        try:
+            self._file = open(self.path, "a")
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except Exception:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, *exc_info):
+        self._release()
+
+    def _release(self):
+        if self._file is not None:
+            # Closing the file releases the flock
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
@@ -5,27 +5,67 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from typing import Dict, Optional, List, Any
+from typing import Dict, Optional, List, Any, Iterator, Tuple
+import asyncio
+import copy
+import dataclasses
+from contextlib import asynccontextmanager
+import hashlib
+import io
 import json
 import logging
+import shutil
+import time
+import tracemalloc
+import uuid
 import aiofiles
+from starlette.concurrency import run_in_threadpool
 
 from app.models.segmentation import CustomerSegmentation
+from app.models import profiling
 from app.models.schemas import CustomerData, SegmentResponse
+from app.models.registry import ModelRegistry, FittedModel
+from app.models.artifacts import ModelArtifacts
+from app.models.backends import get_backend
+from app.jobs import Job, JobManager, ProgressCallback
+from app.storage import ColumnStore, CSVChunkParser, Dataset, SegmentIndex
+from app.instrumentation import Metrics, SamplingProfiler, StageTimings
+from app.responses import NumpyJSONResponse, dumps, dumps_with_json
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging; LOG_LEVEL=DEBUG also logs request payloads
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
+# Measure the bytes allocated by each stage; tracing slows down every allocation, so it is opt-in
+if os.getenv("TRACE_ALLOCATIONS", "0") == "1":
+    tracemalloc.start()
+
+# Allow profiling single requests sent with an "X-Profile: 1" header
+PROFILING_ENABLED = os.getenv("ENABLE_PROFILING", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm-load the latest published model so the first prediction does not need a fit
+    latest = artifacts.latest()
+    if latest is not None:
+        try:
+            entry = registry.add(artifacts.load(latest))
+            logger.info(f"Loaded model version {entry.version}")
+        except Exception as e:
+            logger.warning(f"Could not load model version {latest}: {str(e)}")
+    yield
+
 app = FastAPI(
     title="Customer Segmentation API",
     description="API for demographic customer segmentation in retail/e-commerce",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=NumpyJSONResponse
 )
 
 # Enable CORS
@@ -45,8 +85,331 @@ DATA_DIR.mkdir(exist_ok=True)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
-# Initialize the segmentation model
-segmentation = CustomerSegmentation()
+# Columns every uploaded data file must contain
+REQUIRED_NUMERIC_COLUMNS = [
+    'age', 'income', 'visits_per_month', 'avg_time_spent',
+    'purchase_frequency', 'avg_order_value', 'customer_lifetime_value'
+]
+REQUIRED_COLUMNS = REQUIRED_NUMERIC_COLUMNS + ['gender', 'preferred_category']
+
+# Largest page of customers returned by /customers/
+MAX_PAGE_SIZE = 1000
+
+# Size of the blocks read from an upload at a time
+UPLOAD_CHUNK_BYTES = 4 * 1024 * 1024
+
+# Number of worker processes for the cluster count search (-1 uses all cores)
+SEGMENTATION_N_JOBS = int(os.getenv("SEGMENTATION_N_JOBS", "1"))
+
+# Clustering algorithm fitted unless a request selects another one (see app/models/backends.py)
+SEGMENTATION_ALGORITHM = os.getenv("SEGMENTATION_ALGORITHM", "kmeans")
+
+# Range of segment counts searched, and groups of centers probed when assigning customers to
+# hundreds of segments (unset for an exact assignment)
+SEGMENTATION_MIN_CLUSTERS = int(os.getenv("SEGMENTATION_MIN_CLUSTERS", "3"))
+SEGMENTATION_MAX_CLUSTERS = int(os.getenv("SEGMENTATION_MAX_CLUSTERS", "8"))
+SEGMENTATION_SCORING_PROBES = int(os.environ["SEGMENTATION_SCORING_PROBES"]) if os.getenv("SEGMENTATION_SCORING_PROBES") else None
+
+# Typed columnar copy of the uploaded data, so endpoints do not re-parse the CSV file
+store = ColumnStore(DATA_DIR / "columns")
+
+# Fitted segmentation models, keyed by the fingerprint of the data they were fitted on
+registry = ModelRegistry()
+
+# Published model versions, shared with other worker processes through the models directory
+artifacts = ModelArtifacts(Path("models"))
+
+# Background segmentation runs; identical concurrent submissions share one job, and the state
+# of every job is saved with the models so any worker process can answer for it
+jobs = JobManager(state_dir=artifacts.root / "jobs")
+
+# Stage timings and request durations, exposed at /metrics
+metrics = Metrics()
+
+# Collapsed-stack profiles of single requests
+PROFILE_DIR = DATA_DIR / "profiles"
+
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Record request durations per route, profiling the request if it asks for it."""
+    profiler = None
+    if PROFILING_ENABLED and request.headers.get("x-profile") == "1":
+        profiler = SamplingProfiler()
+        profiler.start()
+    
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+    route = request.scope.get("route")
+    metrics.observe_request(request.method, getattr(route, "path", "unmatched"),
+                            response.status_code, time.perf_counter() - start)
+    
+    if profiler is not None:
+        PROFILE_DIR.mkdir(exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        (PROFILE_DIR / f"{profile_id}.txt").write_text(profiler.collapsed())
+        response.headers["X-Profile-Id"] = profile_id
+    return response
+
+async def current_dataset() -> Dataset:
+    """Return the current dataset, converting a previously uploaded data file on first use."""
+    dataset = store.current()
+    if dataset is not None:
+        return dataset
+    
+    file_path = DATA_DIR / "customer_data.csv"
+    if not file_path.exists():
+        logger.error("No data file found")
+        raise HTTPException(status_code=404, detail="No data file found. Please upload data first.")
+    logger.info("Converting data file to columnar format")
+    return await run_in_threadpool(store.ingest_csv, file_path, REQUIRED_NUMERIC_COLUMNS)
+
+def export_segmented_customers(dataset: Dataset, labels: np.ndarray, file_path: Path):
+    """Write the dataset with its segment labels to CSV, one chunk of rows at a time."""
+    tmp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, "w", newline="") as f:
+            for i, chunk in enumerate(dataset.iter_chunks()):
+                chunk['segment'] = labels[chunk.index]
+                chunk.to_csv(f, header=(i == 0), index=False)
+        os.replace(tmp_path, file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+def publish_model(fingerprint: str, segmentation: CustomerSegmentation,
+                  labels: np.ndarray, insights: Dict) -> FittedModel:
+    """Save a fitted model as a new artifact version and register it."""
+    with segmentation.timings.stage("segment_index", rows=len(labels)):
+        segments = SegmentIndex.build(labels, insights['model_info']['n_clusters'])
+    entry = FittedModel(fingerprint, segmentation, labels, insights, timings=segmentation.timings.records,
+                        segments=segments)
+    metrics.record_stages(entry.timings)
+    try:
+        entry = dataclasses.replace(entry, version=artifacts.save(entry))
+    except Exception as e:
+        logger.warning(f"Could not save model artifact: {str(e)}")
+    return registry.add(entry)
+
+def published_model_version(fingerprint: str,
+                            algorithm: Optional[str] = None) -> Tuple[Optional[FittedModel], Optional[str]]:
+    """Return the registered model for a dataset and the newer published version to load, if any.
+    
+    Without an algorithm, considers the newest model of the dataset whatever its algorithm.
+    """
+    latest = artifacts.latest()
+    if (latest is not None and ModelArtifacts.fingerprint_of(latest) == fingerprint
+            and algorithm in (None, ModelArtifacts.algorithm_of(latest))):
+        # Compare with the cached model of the latest version's algorithm, not the last one used
+        version = latest
+        entry = registry.get(fingerprint, ModelArtifacts.algorithm_of(latest))
+    else:
+        entry = registry.get(fingerprint, algorithm)
+        if entry is not None:
+            return entry, None
+        version = artifacts.latest(fingerprint, algorithm)
+    if version is None or (entry is not None and entry.version == version):
+        return entry, None
+    return entry, version
+
+def load_model_version(version: str, entry: Optional[FittedModel] = None) -> Optional[FittedModel]:
+    """Load and register a published model version, keeping entry if it cannot be loaded."""
+    try:
+        entry = registry.add(artifacts.load(version))
+        logger.info(f"Loaded model version {version}")
+    except Exception as e:
+        logger.warning(f"Could not load model version {version}: {str(e)}")
+    return entry
+
+def load_published_model(fingerprint: str, algorithm: Optional[str] = None) -> Optional[FittedModel]:
+    """Return the newest model for a dataset, loading versions published since it was registered."""
+    entry, version = published_model_version(fingerprint, algorithm)
+    return entry if version is None else load_model_version(version, entry)
+
+async def get_published_model(fingerprint: str, algorithm: Optional[str] = None) -> Optional[FittedModel]:
+    """load_published_model for request handlers: new versions are loaded in the threadpool."""
+    entry, version = published_model_version(fingerprint, algorithm)
+    return entry if version is None else await run_in_threadpool(load_model_version, version, entry)
+
+def model_job_key(fingerprint: str, algorithm: str) -> str:
+    """Key of the jobs fitting or updating the model of a dataset with an algorithm."""
+    return f"{fingerprint}:{algorithm}"
+
+async def job_model(job: Job) -> Optional[FittedModel]:
+    """The model of a completed job, loaded from the published artifacts if another worker ran it."""
+    if job.result is not None:
+        return job.result
+    fingerprint, algorithm = job.key.split(":")
+    return await get_published_model(fingerprint, algorithm)
+
+def fit_dataset(dataset: Dataset, algorithm: str, progress: ProgressCallback) -> FittedModel:
+    """Fit a segmentation model on a dataset and register it. Runs in a job thread.
+    
+    Fits are serialized across worker processes; a worker that waited for another one to fit
+    the same data loads the published model instead of fitting it again.
+    """
+    entry = load_published_model(dataset.fingerprint, algorithm)
+    if entry is not None:
+        return entry
+    
+    progress("waiting")
+    with artifacts.fit_lock:
+        entry = load_published_model(dataset.fingerprint, algorithm)
+        if entry is not None:
+            return entry
+        return fit_and_publish(dataset, algorithm, progress)
+
+def fit_and_publish(dataset: Dataset, algorithm: str, progress: ProgressCallback) -> FittedModel:
+    """Fit a segmentation model on a dataset, then publish and register it."""
+    segmentation = CustomerSegmentation(algorithm=algorithm, n_jobs=SEGMENTATION_N_JOBS,
+                                        min_clusters=SEGMENTATION_MIN_CLUSTERS,
+                                        max_clusters=SEGMENTATION_MAX_CLUSTERS,
+                                        scoring_probes=SEGMENTATION_SCORING_PROBES)
+    segmentation.progress_callback = progress
+    timings = segmentation.timings
+    
+    # Load data
+    logger.info("Loading customer data")
+    progress("loading")
+    with timings.stage("load", rows=dataset.num_rows):
+        df = dataset.load(segmentation.input_columns)
+    logger.info(f"Loaded data with shape: {df.shape}")
+    
+    # Perform segmentation
+    logger.info("Starting segmentation analysis")
+    labels, insights = segmentation.segment_customers(df)
+    logger.info(f"Segmentation completed. Found {len(insights['segment_sizes'])} segments")
+    
+    # Save segmented data
+    progress("saving")
+    try:
+        with timings.stage("export", rows=len(labels)):
+            export_segmented_customers(dataset, labels, DATA_DIR / "segmented_customers.csv")
+        logger.info("Saved segmented customer data")
+    except Exception as e:
+        logger.warning(f"Could not save segmented data: {str(e)}")
+    
+    return publish_model(dataset.fingerprint, segmentation, labels, insights)
+
+def update_dataset(base: Optional[FittedModel], dataset: Dataset, progress: ProgressCallback) -> FittedModel:
+    """Update the model of a dataset with the rows appended to it, refitting only on drift.
+    
+    Runs in a job thread. Without a base model, or when the new rows contain unseen categories
+    or no longer fit the current segments, the model is refitted from scratch with the same
+    algorithm.
+    """
+    algorithm = base.algorithm if base is not None else SEGMENTATION_ALGORITHM
+    entry = load_published_model(dataset.fingerprint, algorithm)
+    if entry is not None:
+        return entry
+    
+    progress("waiting")
+    with artifacts.fit_lock:
+        entry = load_published_model(dataset.fingerprint, algorithm)
+        if entry is not None:
+            return entry
+        if base is None:
+            return fit_and_publish(dataset, algorithm, progress)
+        return update_and_publish(base, dataset, progress)
+
+def update_and_publish(base: FittedModel, dataset: Dataset, progress: ProgressCallback) -> FittedModel:
+    """Update a copy of the base model with the appended rows, then publish and register it."""
+    segmentation = copy.deepcopy(base.segmentation)
+    segmentation.progress_callback = progress
+    segmentation.timings = timings = StageTimings()
+    
+    # Assign the appended rows and move the centers towards them
+    progress("updating", rows=dataset.num_rows - len(base.labels))
+    try:
+        with timings.stage("load", rows=dataset.num_rows - len(base.labels)):
+            delta = dataset.load(segmentation.input_columns, rows=slice(len(base.labels), None))
+        with timings.stage("update", rows=len(delta)):
+            delta_labels, drift = segmentation.partial_fit(delta)
+    except ValueError as e:
+        logger.info(f"Refitting segmentation: {str(e)}")
+        return fit_and_publish(dataset, base.algorithm, progress)
+    if drift > segmentation.drift_threshold:
+        logger.info(f"Refitting segmentation: appended rows drifted by {drift:.2f}")
+        return fit_and_publish(dataset, base.algorithm, progress)
+    logger.info(f"Updated segmentation with {len(delta_labels)} rows (drift {drift:.2f})")
+    
+    labels = np.concatenate([base.labels, delta_labels])
+    with timings.stage("load", rows=dataset.num_rows):
+        df = dataset.load(segmentation.input_columns)
+    insights = segmentation.describe_segments(df, labels)
+    
+    progress("saving")
+    try:
+        with timings.stage("export", rows=len(labels)):
+            export_segmented_customers(dataset, labels, DATA_DIR / "segmented_customers.csv")
+        logger.info("Saved segmented customer data")
+    except Exception as e:
+        logger.warning(f"Could not save segmented data: {str(e)}")
+    
+    return publish_model(dataset.fingerprint, segmentation, labels, insights)
+
+def check_algorithm(algorithm: Optional[str]):
+    """Reject unknown algorithms and those whose optional dependencies are not installed."""
+    if algorithm is None:
+        return
+    try:
+        get_backend(algorithm).check_available()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def submit_segmentation(algorithm: Optional[str] = None) -> Job:
+    """Start a background fit on the current dataset, or join the one already running."""
+    dataset = await current_dataset()
+    algorithm = algorithm or SEGMENTATION_ALGORITHM
+    return jobs.submit(model_job_key(dataset.fingerprint, algorithm),
+                       lambda progress: fit_dataset(dataset, algorithm, progress))
+
+async def get_fitted_model(dataset: Optional[Dataset] = None, algorithm: Optional[str] = None) -> FittedModel:
+    """Return the model fitted on the current dataset, fitting it only when the data has changed.
+    
+    Without an algorithm, returns the newest model of the dataset, or fits the default algorithm.
+    """
+    dataset = dataset or await current_dataset()
+    entry = await get_published_model(dataset.fingerprint, algorithm)
+    if entry is not None:
+        logger.info(f"Using cached {entry.algorithm} model for dataset {dataset.fingerprint}")
+        return entry
+    
+    algorithm = algorithm or SEGMENTATION_ALGORITHM
+    job = jobs.submit(model_job_key(dataset.fingerprint, algorithm),
+                      lambda progress: fit_dataset(dataset, algorithm, progress))
+    return await asyncio.wrap_future(job.future)
+
+def segmentation_response(entry: FittedModel, content: Optional[Dict] = None) -> Response:
+    """Render the insights of a fitted model, the timings of its fit and of this response, and content.
+    
+    The insights are serialized within the json_conversion stage, so its timing covers the
+    actual conversion rather than only assembling the payload.
+    """
+    timings = StageTimings()
+    with timings.stage("json_conversion", rows=len(entry.labels)):
+        insights = dumps(segmentation_insights(entry))
+    metrics.record_stages(timings.records)
+    content = {**(content or {}), "timings": {"fit": entry.timings, "response": timings.records}}
+    return Response(content=dumps_with_json(content, insights=insights), media_type="application/json")
+
+def segmentation_insights(entry: FittedModel) -> Dict:
+    """Build the insights payload returned for a fitted model."""
+    # Copy the cached insights before adding to them; numpy values are serialized by the response
+    insights = dict(entry.insights)
+    
+    # Add summary statistics
+    insights['summary'] = {
+        'total_customers': len(entry.labels),
+        'segments_found': len(insights['segment_sizes']),
+        'model_quality': {
+            'silhouette_score': insights['model_info']['silhouette_score'],
+            'features_used': len(insights['model_info']['features_used'])
+        }
+    }
+    return insights
 
 @app.get("/")
 async def root(request: Request):
@@ -56,6 +419,70 @@ async def root(request: Request):
 async def health_check():
     return {"status": "healthy", "version": "1.0.0"}
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str):
+    try:
+        path = PROFILE_DIR / f"{uuid.UUID(hex=profile_id).hex}.txt"
+    except ValueError:
+        path = None
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found")
+    return FileResponse(path, media_type="text/plain")
+
+def ingest_block(parser: CSVChunkParser, writer, digest, block: Optional[bytes]):
+    """Hash, parse and store one block of an upload, or the rows left at its end when block is None."""
+    if block is None:
+        chunk = parser.close()
+    else:
+        digest.update(block)
+        chunk = parser.feed(block)
+    if chunk is not None:
+        writer.append(chunk)
+
+async def stream_upload(file: UploadFile, tmp_path: Path, base: Optional[Dataset] = None):
+    """Stream an uploaded CSV file to disk and into a new dataset version chunk by chunk.
+    
+    The header is validated on the first chunk and the column types on every chunk. Parsing and
+    storing run in the threadpool, one call per block, so large uploads do not block other
+    requests. Returns the writer, ready to commit, and the digest of the uploaded bytes.
+    """
+    parser = CSVChunkParser(REQUIRED_COLUMNS)
+    writer = await run_in_threadpool(store.writer, REQUIRED_NUMERIC_COLUMNS, base)
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        async with aiofiles.open(tmp_path, 'wb') as out_file:
+            while block := await file.read(UPLOAD_CHUNK_BYTES):
+                await out_file.write(block)
+                await run_in_threadpool(ingest_block, parser, writer, digest, block)
+        await run_in_threadpool(ingest_block, parser, writer, digest, None)
+    except Exception:
+        writer.abort()
+        tmp_path.unlink(missing_ok=True)
+        raise
+    logger.info(f"Received {parser.rows} rows")
+    return writer, digest
+
+def append_csv_rows(file_path: Path, delta_path: Path):
+    """Atomically replace a CSV file with a copy that has the rows of another CSV file appended."""
+    tmp_path = file_path.with_name(f"{file_path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copyfile(file_path, tmp_path)
+        with open(delta_path, "rb") as src, open(tmp_path, "r+b") as dst:
+            dst.seek(0, os.SEEK_END)
+            if dst.tell():
+                dst.seek(-1, os.SEEK_END)
+                if dst.read(1) != b"\n":
+                    dst.write(b"\n")
+            src.readline()  # skip the header
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, file_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
 @app.post("/upload-data/")
 async def upload_data(file: UploadFile):
     try:
@@ -64,117 +491,87 @@ async def upload_data(file: UploadFile):
         # Create data directory if it doesn't exist
         DATA_DIR.mkdir(exist_ok=True)
         file_path = DATA_DIR / "customer_data.csv"
+        tmp_path = DATA_DIR / f"customer_data.{uuid.uuid4().hex}.tmp"
         
-        # Save uploaded file
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await file.read()
-            await out_file.write(content)
-        
-        # Read and validate CSV
-        df = pd.read_csv(file_path)
-        logger.info(f"Successfully read CSV with shape: {df.shape}")
-        
-        # Verify required columns
-        required_columns = [
-            'age', 'income', 'visits_per_month', 'avg_time_spent',
-            'purchase_frequency', 'avg_order_value', 'customer_lifetime_value',
-            'gender', 'preferred_category'
-        ]
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise ValueError(f"Missing required columns: {missing_columns}")
+        writer, digest = await stream_upload(file, tmp_path)
+        try:
+            dataset = await run_in_threadpool(writer.commit, digest.hexdigest())
+            os.replace(tmp_path, file_path)
+        except Exception:
+            writer.abort()
+            tmp_path.unlink(missing_ok=True)
+            raise
+        logger.info(f"Stored dataset with {dataset.num_rows} rows and {len(dataset.columns)} columns")
         
-        return {"message": "File uploaded successfully", "shape": df.shape}
+        return {"message": "File uploaded successfully", "shape": (dataset.num_rows, len(dataset.columns))}
     except Exception as e:
         logger.error(f"Error in upload_data: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
 
-@app.get("/data-summary/")
-async def get_data_summary():
+@app.post("/append-data/")
+async def append_data(file: UploadFile):
     try:
+        logger.info(f"Receiving appended data: {file.filename}")
+        base_dataset = await current_dataset()
+        base = await get_published_model(base_dataset.fingerprint)
+        
         file_path = DATA_DIR / "customer_data.csv"
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="No data file found. Please upload data first.")
+        tmp_path = DATA_DIR / f"customer_data.{uuid.uuid4().hex}.tmp"
         
-        logger.info("Reading data file for summary")
-        df = pd.read_csv(file_path)
+        # The new version is the current one plus the appended rows
+        writer, digest = await stream_upload(file, tmp_path, base=base_dataset)
+        try:
+            fingerprint = hashlib.blake2b(f"{base_dataset.fingerprint}:{digest.hexdigest()}".encode(),
+                                          digest_size=16).hexdigest()
+            dataset = await run_in_threadpool(writer.commit, fingerprint)
+            if file_path.exists():
+                await run_in_threadpool(append_csv_rows, file_path, tmp_path)
+        except Exception:
+            writer.abort()
+            raise
+        finally:
+            tmp_path.unlink(missing_ok=True)
+        logger.info(f"Appended {dataset.num_rows - base_dataset.num_rows} rows")
         
-        summary = {
-            "total_customers": len(df),
-            "columns": list(df.columns),
-            "numeric_columns_summary": {
-                col: {
-                    "mean": float(df[col].mean()),
-                    "median": float(df[col].median()),
-                    "std": float(df[col].std()),
-                    "min": float(df[col].min()),
-                    "max": float(df[col].max()),
-                    "quartiles": {
-                        "25%": float(df[col].quantile(0.25)),
-                        "75%": float(df[col].quantile(0.75))
-                    }
-                }
-                for col in df.select_dtypes(include=[np.number]).columns
-            },
-            "categorical_columns_summary": {
-                col: {
-                    "value_counts": df[col].value_counts().to_dict(),
-                    "unique_values": len(df[col].unique())
-                }
-                for col in df.select_dtypes(include=['object']).columns
-            }
+        # Update the segmentation in the background instead of refitting from scratch
+        algorithm = base.algorithm if base is not None else SEGMENTATION_ALGORITHM
+        job = jobs.submit(model_job_key(dataset.fingerprint, algorithm),
+                          lambda progress: update_dataset(base, dataset, progress))
+        
+        return {
+            "message": "Data appended successfully",
+            "shape": (dataset.num_rows, len(dataset.columns)),
+            "job": job.to_dict()
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in append_data: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/data-summary/")
+async def get_data_summary():
+    try:
+        dataset = await current_dataset()
+        summary = await run_in_threadpool(dataset.summary_dict)
         
         logger.info("Data summary generated successfully")
-        return summary
+        return NumpyJSONResponse(content=summary)
     
     except Exception as e:
         logger.error(f"Error in get_data_summary: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/segment-customers/")
-async def segment_customers():
+async def segment_customers(algorithm: Optional[str] = None):
+    check_algorithm(algorithm)
     try:
         logger.info("Starting customer segmentation process")
-        
-        # Check if data file exists
-        file_path = DATA_DIR / "customer_data.csv"
-        if not file_path.exists():
-            logger.error("No data file found")
-            raise HTTPException(status_code=404, detail="No data file found. Please upload data first.")
-        
-        # Load data
-        logger.info("Loading customer data")
-        df = pd.read_csv(file_path)
-        logger.info(f"Loaded data with shape: {df.shape}")
-        
-        # Perform segmentation
-        logger.info("Starting segmentation analysis")
-        df_segmented, insights = segmentation.segment_customers(df)
-        logger.info(f"Segmentation completed. Found {len(insights['segment_sizes'])} segments")
-        
-        # Save segmented data
-        try:
-            df_segmented.to_csv(DATA_DIR / "segmented_customers.csv", index=False)
-            logger.info("Saved segmented customer data")
-        except Exception as e:
-            logger.warning(f"Could not save segmented data: {str(e)}")
-        
-        # Convert numpy types to Python native types
-        insights = json.loads(json.dumps(insights, default=lambda x: float(x) if isinstance(x, np.number) else x))
-        
-        # Add summary statistics
-        insights['summary'] = {
-            'total_customers': len(df),
-            'segments_found': len(insights['segment_sizes']),
-            'model_quality': {
-                'silhouette_score': insights['model_info']['silhouette_score'],
-                'features_used': len(insights['model_info']['features_used'])
-            }
-        }
+        entry = await get_fitted_model(algorithm=algorithm)
+        response = segmentation_response(entry)
         
         logger.info("Returning segmentation insights")
-        return JSONResponse(content={"insights": insights})
+        return response
     
     except Exception as e:
         logger.error(f"Error in segment_customers: {str(e)}")
@@ -187,24 +584,43 @@ async def segment_customers():
             }
         )
 
+@app.post("/segmentation-jobs/")
+async def create_segmentation_job(algorithm: Optional[str] = None):
+    check_algorithm(algorithm)
+    job = await submit_segmentation(algorithm)
+    logger.info(f"Segmentation job {job.id} is {job.status}")
+    return JSONResponse(status_code=202, content=job.to_dict())
+
+@app.get("/segmentation-jobs/{job_id}")
+async def get_segmentation_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Segmentation job {job_id} not found")
+    
+    content = job.to_dict()
+    if job.status == "completed":
+        entry = await job_model(job)
+        if entry is not None:
+            return segmentation_response(entry, content)
+    return NumpyJSONResponse(content=content)
+
 @app.post("/predict-segment/")
 async def predict_segment(customer_data: Dict[str, Any]):
     try:
         logger.info("Starting segment prediction for single customer")
-        logger.debug(f"Input customer data: {customer_data}")
+        logger.debug("Input customer data: %s", customer_data)
         
         # Convert numpy types to Python native types
         customer_data = {k: float(v) if isinstance(v, (np.number, int, float)) else v 
                         for k, v in customer_data.items()}
         
         # Predict segment
-        segment_id, segment_label = segmentation.predict_segment(customer_data)
+        entry = await get_fitted_model()
+        segment_id, segment_label = entry.segmentation.predict_segment(customer_data)
         logger.info(f"Predicted segment {segment_id}: {segment_label}")
         
         # Get segment characteristics
-        df = pd.read_csv(DATA_DIR / "customer_data.csv")
-        df_segmented, insights = segmentation.segment_customers(df)
-        segment_profile = insights['segment_profiles'][f'Segment_{segment_id}']
+        segment_profile = entry.insights['segment_profiles'][f'Segment_{segment_id}']
         
         response = {
             "segment": int(segment_id),
@@ -213,11 +629,8 @@ async def predict_segment(customer_data: Dict[str, Any]):
             "segment_characteristics": segment_profile
         }
         
-        # Convert numpy types to Python native types
-        response = json.loads(json.dumps(response, default=lambda x: float(x) if isinstance(x, np.number) else x))
-        
         logger.info("Successfully generated prediction response")
-        return response
+        return NumpyJSONResponse(content=response)
     
     except Exception as e:
         logger.error(f"Error in predict_segment: {str(e)}")
@@ -230,44 +643,208 @@ async def predict_segment(customer_data: Dict[str, Any]):
             }
         )
 
+def read_batch(body: bytes, content_type: str, filename: str = "") -> pd.DataFrame:
+    """Parse a batch of customers sent as a JSON array, a CSV file or an Arrow file."""
+    if content_type.startswith("application/json"):
+        records = json.loads(body)
+        if not isinstance(records, list):
+            raise ValueError("Expected a JSON array of customer records")
+        return pd.DataFrame.from_records(records)
+    if "arrow" in content_type or filename.endswith((".arrow", ".feather")):
+        return pd.read_feather(io.BytesIO(body))
+    return pd.read_csv(io.BytesIO(body))
+
+def iter_predictions(df: pd.DataFrame, segments: np.ndarray, descriptions: Dict,
+                     chunk_size: int = 10000) -> Iterator[str]:
+    """Yield segment predictions as newline-delimited JSON, one chunk of rows at a time."""
+    labels = {int(segment): json.dumps(label) for segment, label in descriptions.items()}
+    customer_ids = None
+    if 'customer_id' in df.columns:
+        if pd.api.types.is_integer_dtype(df['customer_id']):
+            customer_ids = [str(c) for c in df['customer_id'].tolist()]
+        else:
+            customer_ids = [json.dumps(c) for c in df['customer_id'].tolist()]
+    
+    for start in range(0, len(segments), chunk_size):
+        chunk = segments[start:start + chunk_size].tolist()
+        if customer_ids is None:
+            lines = [f'{{"segment": {s}, "segment_label": {labels[s]}}}' for s in chunk]
+        else:
+            lines = [f'{{"customer_id": {c}, "segment": {s}, "segment_label": {labels[s]}}}'
+                     for c, s in zip(customer_ids[start:start + chunk_size], chunk)]
+        yield "\n".join(lines) + "\n"
+
+@app.post("/predict-segments/")
+async def predict_segments(request: Request):
+    try:
+        logger.info("Starting batch segment prediction")
+        entry = await get_fitted_model()
+        
+        # Accept a raw JSON/CSV/Arrow body or a multipart file upload
+        content_type = request.headers.get("content-type", "")
+        filename = ""
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            if upload is None:
+                raise ValueError("Expected a file field named 'file'")
+            body = await upload.read()
+            content_type = upload.content_type or ""
+            filename = upload.filename or ""
+        else:
+            body = await request.body()
+        
+        # Parse and score in the threadpool, so large batches do not block other requests
+        df = await run_in_threadpool(read_batch, body, content_type, filename)
+        segments = await run_in_threadpool(entry.segmentation.predict_batch, df)
+        logger.info(f"Predicted segments for {len(segments)} customers")
+        
+        return StreamingResponse(
+            iter_predictions(df, segments, entry.segmentation.segment_descriptions),
+            media_type="application/x-ndjson"
+        )
+    
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Invalid batch in predict_segments: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in predict_segments: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": str(e),
+                "type": type(e).__name__,
+                "detail": "Error occurred during batch segment prediction"
+            }
+        )
+
 @app.get("/segment-analysis/")
 async def get_segment_analysis():
     try:
-        # Load data and perform segmentation
-        df = pd.read_csv(DATA_DIR / "customer_data.csv")
-        df_segmented, insights = segmentation.segment_customers(df)
+        # Load data and attach the segments of the fitted model
+        dataset = await current_dataset()
+        entry = await get_fitted_model(dataset)
+        segmentation = entry.segmentation
+        n_clusters = entry.insights['model_info']['n_clusters']
+        
+        # Statistics of every numeric column for all segments in one grouped pass
+        columns = {col: dataset.column(col) for col in segmentation.numeric_features}
+        stats = await run_in_threadpool(
+            profiling.segment_numeric_stats, entry.labels, columns, n_clusters,
+            ('mean', 'median', 'std', 'min', 'max')
+        )
+        sizes = profiling.segment_sizes(entry.labels, n_clusters)
         
         # Basic statistics for each segment
         analysis = {
-            "total_customers": len(df),
-            "number_of_segments": 4,
+            "total_customers": len(entry.labels),
+            "number_of_segments": n_clusters,
             "segment_statistics": {}
         }
         
-        for segment in range(4):
-            segment_data = df_segmented[df_segmented['segment'] == segment]
-            
-            # Calculate statistics for numeric columns
-            numeric_stats = {}
-            for col in segmentation.required_features:
-                stats = {
-                    "mean": float(segment_data[col].mean()),
-                    "median": float(segment_data[col].median()),
-                    "std": float(segment_data[col].std()),
-                    "min": float(segment_data[col].min()),
-                    "max": float(segment_data[col].max())
-                }
-                numeric_stats[col] = stats
+        for segment in range(n_clusters):
+            row = stats.loc[segment]
+            numeric_stats = {
+                col: {stat: float(row[(col, stat)]) for stat in ('mean', 'median', 'std', 'min', 'max')}
+                for col in segmentation.numeric_features
+            }
             
             analysis["segment_statistics"][f"Segment_{segment}"] = {
-                "size": len(segment_data),
-                "percentage": float(len(segment_data) / len(df) * 100),
+                "size": int(sizes[segment]),
+                "percentage": float(sizes[segment] / len(entry.labels) * 100),
                 "numeric_stats": numeric_stats
             }
         
-        # Convert numpy types to Python native types
-        analysis = json.loads(json.dumps(analysis, default=lambda x: float(x) if isinstance(x, np.number) else x))
+        return NumpyJSONResponse(content=analysis)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_customer_query(dataset: Dataset, query_params, columns: Optional[str]):
+    """Validate the column projection and the min_/max_ range filters of a /customers/ request."""
+    selected = dataset.columns if not columns else [name.strip() for name in columns.split(",") if name.strip()]
+    unknown = [name for name in selected if name not in dataset.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown columns: {unknown}")
+    
+    ranges: Dict[str, List[Optional[float]]] = {}
+    for key, value in query_params.items():
+        if not key.startswith(("min_", "max_")):
+            continue
+        name = key[4:]
+        if name not in dataset.columns or dataset.is_categorical(name):
+            raise HTTPException(status_code=400, detail=f"Cannot filter on {name!r}: not a numeric column")
+        try:
+            bound = float(value)
+        except ValueError:
+            raise HTTPException(status_code=400, detail=f"Invalid value for {key}: {value!r}")
+        ranges.setdefault(name, [None, None])[key.startswith("max_")] = bound
+    return selected, {name: tuple(bounds) for name, bounds in ranges.items()}
+
+def find_customers(dataset: Dataset, entry: FittedModel, segment: Optional[int], ranges: Dict,
+                   columns: List[str], start: int, stop: int) -> Tuple[int, List[Dict]]:
+    """Return the number of matching customers and the records of rows start to stop among them.
+    
+    The segment index and the filtered columns select the matching rows, and only the rows of the
+    page are read from the projected columns.
+    """
+    segments = entry.segments or SegmentIndex.build(entry.labels, entry.insights['model_info']['n_clusters'])
+    rows = segments.segment(segment) if segment is not None else None
+    if rows is None and not ranges:
+        total = dataset.num_rows
+        page = np.arange(min(start, total), min(stop, total))
+    else:
+        rows = dataset.filter_rows(ranges, rows)
+        total = len(rows)
+        page = rows[start:stop]
+    
+    df = dataset.load(columns, rows=page)
+    df['segment'] = entry.labels[page]
+    return total, df.to_dict('records')
+
+@app.get("/customers/")
+async def get_customers(request: Request, segment: Optional[int] = None, page: int = 1,
+                        page_size: int = 100, columns: Optional[str] = None, algorithm: Optional[str] = None):
+    """Page through the segmented customers.
+    
+    Filter with segment and numeric ranges such as min_income=50000&max_customer_lifetime_value=2000,
+    and select the returned columns with a comma-separated columns list.
+    """
+    check_algorithm(algorithm)
+    if page < 1 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"Expected page >= 1 and 1 <= page_size <= {MAX_PAGE_SIZE}")
+    try:
+        dataset = await current_dataset()
+        entry = await get_fitted_model(dataset, algorithm)
+        n_clusters = entry.insights['model_info']['n_clusters']
+        if segment is not None and not 0 <= segment < n_clusters:
+            raise HTTPException(status_code=404, detail=f"Segment {segment} not found")
+        selected, ranges = parse_customer_query(dataset, request.query_params, columns)
         
-        return analysis
+        start = (page - 1) * page_size
+        total, customers = await run_in_threadpool(
+            find_customers, dataset, entry, segment, ranges, selected, start, start + page_size
+        )
+        
+        return NumpyJSONResponse(content={
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "pages": -(-total // page_size),
+            "segment": segment,
+            "algorithm": entry.algorithm,
+            "customers": customers
+        })
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        logger.error(f"Error in get_customers: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": str(e),
+                "type": type(e).__name__,
+                "detail": "Error occurred while retrieving customers"
+            }
+        )
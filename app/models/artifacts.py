@@ -0,0 +1,132 @@
+from pathlib import Path
+from typing import List, Optional
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+
+from app.locks import FileLock
+from app.models.registry import FittedModel
+from app.models.segmentation import CustomerSegmentation
+from app.storage import SegmentIndex
+
+logger = logging.getLogger(__name__)
+
+# Version of the on-disk artifact layout, bumped on incompatible changes
+FORMAT_VERSION = 1
+
+
+class ModelArtifacts:
+    """Versioned on-disk store of fitted segmentation models.
+
+    Each version is a directory named "<generation>-<dataset fingerprint>-<algorithm>" holding the model
+    parameters and cached insights as JSON and the arrays (centers, scaler statistics, labels,
+    segment index) as .npy files that are memory-mapped on load. Versions are written to a temporary directory
+    and renamed into place, and a LATEST file names the newest one, so readers never see a
+    partial version. Published versions are never modified, so worker processes can share them.
+    """
+
+    def __init__(self, root: Path, keep_versions: int = 3):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep_versions = keep_versions
+
+        # Generations are allocated under a lock shared with the other worker processes
+        self._lock = FileLock(self.root / "publish.lock")
+
+        # Held while fitting, so concurrent workers fit each dataset only once
+        self.fit_lock = FileLock(self.root / "fit.lock")
+
+    @staticmethod
+    def fingerprint_of(version: str) -> str:
+        """The fingerprint of the dataset a version was fitted on."""
+        return version.split("-")[1]
+
+    @staticmethod
+    def algorithm_of(version: str) -> str:
+        """The clustering algorithm of a version; versions published before it was recorded are k-means."""
+        parts = version.split("-")
+        return parts[2] if len(parts) > 2 else "kmeans"
+
+    def versions(self) -> List[str]:
+        """Published versions, oldest first."""
+        return sorted(p.name for p in self.root.iterdir()
+                      if p.is_dir() and not p.name.startswith("tmp-") and (p / "model.json").exists())
+
+    def latest(self, fingerprint: Optional[str] = None, algorithm: Optional[str] = None) -> Optional[str]:
+        """The newest published version, or the newest one fitted on the given dataset and with the given algorithm."""
+        if fingerprint is None and algorithm is None:
+            try:
+                return (self.root / "LATEST").read_text().strip() or None
+            except FileNotFoundError:
+                return None
+        matching = [version for version in self.versions()
+                    if fingerprint in (None, self.fingerprint_of(version))
+                    and algorithm in (None, self.algorithm_of(version))]
+        return matching[-1] if matching else None
+
+    def save(self, entry: FittedModel) -> str:
+        """Write a fitted model as a new version and make it the latest. Returns the version."""
+        arrays, params = entry.segmentation.get_state()
+        arrays["labels"] = np.asarray(entry.labels)
+        if entry.segments is not None:
+            arrays["segment_rows"] = entry.segments.rows
+            arrays["segment_offsets"] = entry.segments.offsets
+
+        path = self.root / f"tmp-{uuid.uuid4().hex}"
+        path.mkdir()
+        try:
+            for name, array in arrays.items():
+                np.save(path / f"{name}.npy", np.ascontiguousarray(array))
+            artifact = {
+                "format_version": FORMAT_VERSION,
+                "fingerprint": entry.fingerprint,
+                "created_at": time.time(),
+                "params": params,
+                "insights": entry.insights,
+                "timings": entry.timings,
+            }
+            with open(path / "model.json", "w") as f:
+                json.dump(artifact, f, default=lambda x: x.item() if isinstance(x, np.generic) else x)
+            return self._publish(path, f"{entry.fingerprint}-{entry.algorithm}")
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            raise
+
+    def load(self, version: str) -> FittedModel:
+        """Load a published version, memory-mapping its arrays."""
+        path = self.root / version
+        with open(path / "model.json") as f:
+            artifact = json.load(f)
+        if artifact["format_version"] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact format {artifact['format_version']} in {version}")
+
+        arrays = {p.stem: np.load(p, mmap_mode="r") for p in path.glob("*.npy")}
+        labels = arrays.pop("labels")
+        if "segment_rows" in arrays:
+            segments = SegmentIndex(arrays.pop("segment_rows"), arrays.pop("segment_offsets"))
+        else:
+            segments = SegmentIndex.build(labels, artifact["insights"]["model_info"]["n_clusters"])
+        segmentation = CustomerSegmentation.from_state(arrays, artifact["params"])
+        return FittedModel(artifact["fingerprint"], segmentation, labels, artifact["insights"], version,
+                           artifact.get("timings", []), segments)
+
+    def _publish(self, path: Path, name: str) -> str:
+        with self._lock:
+            generation = max((int(version.split("-", 1)[0]) for version in self.versions()), default=0) + 1
+            version = f"{generation:08d}-{name}"
+            os.rename(path, self.root / version)
+            tmp = self.root / f"LATEST.{uuid.uuid4().hex}"
+            tmp.write_text(version)
+            os.replace(tmp, self.root / "LATEST")
+            self._remove_old_versions()
+        logger.info(f"Published model version {version}")
+        return version
+
+    def _remove_old_versions(self):
+        for version in self.versions()[:-self.keep_versions]:
+            shutil.rmtree(self.root / version, ignore_errors=True)
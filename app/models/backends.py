@@ -0,0 +1,126 @@
+from typing import Dict, Optional
+import numpy as np
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from app.models.scoring import CentroidIndex
+
+
+class ClusteringBackend:
+    """Creates the clustering estimators fitted by CustomerSegmentation.
+
+    Estimators provide fit_predict, and once fitted cluster_centers_, labels_ and inertia_ (the
+    sum of squared distances of the rows to their centers), like the scikit-learn k-means ones.
+    """
+    name: str = ''
+
+    # Whether estimators can start from given centers, as the warm-started search does
+    supports_init = True
+
+    # Whether fitted centers can be moved to the mean of their members as rows are appended;
+    # otherwise appended rows trigger a refit
+    supports_partial_fit = True
+
+    def __init__(self, random_state: int = 42):
+        self.random_state = random_state
+
+    def check_available(self):
+        """Raise ValueError if the backend needs a package that cannot be imported."""
+
+    def make_estimator(self, n_clusters: int, init: Optional[np.ndarray] = None):
+        raise NotImplementedError
+
+
+class KMeansBackend(ClusteringBackend):
+    """Lloyd k-means on all rows, keeping the best of 10 initializations."""
+    name = 'kmeans'
+
+    def make_estimator(self, n_clusters: int, init: Optional[np.ndarray] = None):
+        if init is not None:
+            return KMeans(n_clusters=n_clusters, init=init, n_init=1, random_state=self.random_state)
+        return KMeans(n_clusters=n_clusters, n_init=10, random_state=self.random_state)
+
+
+class MiniBatchKMeansBackend(ClusteringBackend):
+    """Mini-batch k-means, which updates the centers from one batch of rows at a time.
+
+    Much faster than k-means on large data, for slightly worse centers.
+    """
+    name = 'minibatch'
+
+    def __init__(self, random_state: int = 42, batch_size: int = 4096):
+        super().__init__(random_state)
+        self.batch_size = batch_size
+
+    def make_estimator(self, n_clusters: int, init: Optional[np.ndarray] = None):
+        if init is not None:
+            return MiniBatchKMeans(n_clusters=n_clusters, init=init, n_init=1,
+                                   batch_size=self.batch_size, random_state=self.random_state)
+        return MiniBatchKMeans(n_clusters=n_clusters, n_init=3, batch_size=self.batch_size,
+                               random_state=self.random_state)
+
+
+class SampledKMedoids:
+    """k-medoids fitted on a random sample of rows, then every row assigned to its nearest medoid.
+
+    k-medoids needs the pairwise distances of the rows it is fitted on, so it only scales to a
+    sample. The centers are actual customers, which makes the segments less sensitive to outliers.
+    """
+
+    def __init__(self, n_clusters: int, sample_size: int, random_state: int):
+        self.n_clusters = n_clusters
+        self.sample_size = sample_size
+        self.random_state = random_state
+
+    def fit(self, X: np.ndarray) -> "SampledKMedoids":
+        from sklearn_extra.cluster import KMedoids
+
+        rng = np.random.RandomState(self.random_state)
+        sample = X if len(X) <= self.sample_size else X[rng.choice(len(X), self.sample_size, replace=False)]
+        medoids = KMedoids(n_clusters=self.n_clusters, method='alternate', init='k-medoids++',
+                           random_state=self.random_state).fit(sample)
+        self.cluster_centers_ = np.array(medoids.cluster_centers_, dtype=np.float64)
+
+        # Assignment pass over all rows
+        self.labels_, distances = CentroidIndex(self.cluster_centers_).query(X, return_distance=True)
+        self.inertia_ = float(distances.sum())
+        return self
+
+    def fit_predict(self, X: np.ndarray) -> np.ndarray:
+        return self.fit(X).labels_
+
+
+class KMedoidsBackend(ClusteringBackend):
+    """k-medoids from scikit-learn-extra, fitted on a sample of rows (see SampledKMedoids)."""
+    name = 'kmedoids'
+    supports_init = False
+    # Centers must stay actual customers, which a mean update would break
+    supports_partial_fit = False
+
+    def __init__(self, random_state: int = 42, sample_size: int = 4000):
+        super().__init__(random_state)
+        self.sample_size = sample_size
+
+    def check_available(self):
+        try:
+            import sklearn_extra  # noqa: F401
+        except (ImportError, ValueError) as e:
+            # ValueError is raised by builds for another numpy version
+            raise ValueError(f"The kmedoids algorithm requires scikit-learn-extra, which could not be imported: {e}")
+
+    def make_estimator(self, n_clusters: int, init: Optional[np.ndarray] = None):
+        if init is not None:
+            raise ValueError("kmedoids cannot start from given centers")
+        self.check_available()
+        return SampledKMedoids(n_clusters, self.sample_size, self.random_state)
+
+
+BACKENDS: Dict[str, type] = {
+    backend.name: backend for backend in (KMeansBackend, MiniBatchKMeansBackend, KMedoidsBackend)
+}
+
+
+def get_backend(name: str, random_state: int = 42) -> ClusteringBackend:
+    """Create the clustering backend with the given name."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown algorithm {name!r}, expected one of {tuple(BACKENDS)}")
+    return BACKENDS[name](random_state=random_state)
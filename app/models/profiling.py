@@ -0,0 +1,38 @@
+from typing import Dict, Optional, Sequence
+import pandas as pd
+import numpy as np
+
+
+def segment_sizes(labels: np.ndarray, n_segments: int) -> np.ndarray:
+    """Number of customers in each segment."""
+    return np.bincount(labels, minlength=n_segments)
+
+
+def segment_numeric_stats(labels: np.ndarray, columns: Dict[str, np.ndarray], n_segments: int,
+                          stats: Sequence[str] = ('mean',)) -> pd.DataFrame:
+    """Aggregate numeric columns per segment in a single grouped pass.
+
+    Returns one row per segment and a (column, statistic) column for every requested statistic.
+    """
+    df = pd.DataFrame(columns)
+    return df.groupby(labels).agg(list(stats)).reindex(range(n_segments))
+
+
+def segment_value_counts(labels: np.ndarray, values: pd.Series, n_segments: int) -> pd.DataFrame:
+    """Count the values of a categorical column per segment with one bincount over (segment, value)."""
+    categorical = values.array if isinstance(values.dtype, pd.CategoricalDtype) else pd.Categorical(values)
+    codes = np.asarray(categorical.codes)
+    n_values = len(categorical.categories)
+
+    # Missing values have code -1 and are not counted
+    valid = codes >= 0
+    counts = np.bincount(labels[valid] * n_values + codes[valid], minlength=n_segments * n_values)
+    return pd.DataFrame(counts.reshape(n_segments, n_values), columns=categorical.categories)
+
+
+def top_values(counts: pd.Series, n: Optional[int] = None, normalize: bool = False) -> Dict:
+    """Values of one segment's counts from most to least frequent, like Series.value_counts."""
+    if normalize:
+        counts = counts / counts.sum()
+    counts = counts.sort_values(ascending=False, kind='stable')
+    return (counts if n is None else counts.head(n)).to_dict()
@@ -0,0 +1,67 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import threading
+
+import numpy as np
+
+from app.models.segmentation import CustomerSegmentation
+from app.storage import SegmentIndex
+
+
+@dataclass(frozen=True)
+class FittedModel:
+    """A fitted segmentation model together with the results of its fit.
+
+    Entries are never modified once registered: updates register a new entry, so a request
+    keeps using the model it started with while others swap in.
+    """
+    fingerprint: str
+    segmentation: CustomerSegmentation
+    labels: np.ndarray
+    insights: Dict
+    version: Optional[str] = None  # published artifact version, if any
+    timings: List[Dict] = field(default_factory=list)  # stages of the fit that produced it
+    segments: Optional[SegmentIndex] = None  # row ids of each segment, for paging through customers
+
+    @property
+    def algorithm(self) -> str:
+        return self.segmentation.algorithm
+
+    @property
+    def key(self) -> Tuple[str, str]:
+        """Dataset fingerprint and clustering algorithm, which identify the model."""
+        return self.fingerprint, self.algorithm
+
+
+class ModelRegistry:
+    """In-process cache of fitted segmentation models keyed by dataset fingerprint and algorithm."""
+
+    def __init__(self, max_entries: int = 4):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], FittedModel]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, fingerprint: str, algorithm: Optional[str] = None) -> Optional[FittedModel]:
+        """Return the fitted model for a dataset fingerprint, if one is cached.
+
+        Without an algorithm, returns the most recently used model of the dataset.
+        """
+        with self._lock:
+            if algorithm is None:
+                entry = next((entry for key, entry in reversed(self._entries.items())
+                              if key[0] == fingerprint), None)
+            else:
+                entry = self._entries.get((fingerprint, algorithm))
+            if entry is not None:
+                self._entries.move_to_end(entry.key)
+            return entry
+
+    def add(self, entry: FittedModel) -> FittedModel:
+        """Register a fitted model entry, replacing any entry for the same fingerprint and algorithm."""
+        with self._lock:
+            self._entries[entry.key] = entry
+            self._entries.move_to_end(entry.key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
@@ -0,0 +1,122 @@
+from typing import Optional, Tuple, Union
+import numpy as np
+from sklearn.cluster import KMeans
+
+# Memory budget of one block of the row-by-center distance matrix, small enough to stay in cache
+BLOCK_BYTES = 4 * 2 ** 20
+
+# Rows assigned at a time by the approximate search, bounding the size of its per-row bookkeeping
+GROUPED_BLOCK_ROWS = 65536
+
+# Number of centers from which the approximate search is used when enabled; below it the exact
+# search is as fast
+INDEX_MIN_CLUSTERS = 256
+
+
+def _squared_distances(X: np.ndarray, centers: np.ndarray, norms: np.ndarray) -> np.ndarray:
+    """Squared distances between rows and centers, up to the per-row constant ||x||^2."""
+    distances = X @ centers.T
+    distances *= -2
+    distances += norms
+    return distances
+
+
+def _row_norms(X: np.ndarray) -> np.ndarray:
+    return np.einsum('ij,ij->i', X, X)
+
+
+class CentroidIndex:
+    """Nearest-center lookup over a fixed set of cluster centers.
+
+    Squared distances are computed as ||c||^2 - 2 x.c with precomputed center norms, one block of
+    rows at a time, so each block is a single matrix product whose result stays in cache. This
+    search is exact and its cost grows linearly with the number of centers k.
+
+    For fine-grained segmentations with hundreds of centers, n_probe enables an approximate
+    search: the centers are grouped around about sqrt(k) group centers, and each row is only
+    compared with the members of the n_probe groups nearest to it, so an assignment costs about
+    (1 + n_probe) * sqrt(k) distances instead of k. Rows near the boundary of two segments may
+    then be assigned to the second nearest center.
+    """
+
+    def __init__(self, centers: np.ndarray, n_probe: Optional[int] = None,
+                 index_min_clusters: int = INDEX_MIN_CLUSTERS, random_state: int = 0):
+        if n_probe is not None and n_probe < 1:
+            raise ValueError(f"n_probe must be at least 1, got {n_probe}")
+        self.centers = np.ascontiguousarray(centers, dtype=np.float64)
+        self.norms = _row_norms(self.centers)
+        self.n_probe = n_probe
+
+        self._group_centers = None
+        if n_probe is not None and len(self.centers) >= index_min_clusters:
+            self._build_groups(int(np.sqrt(len(self.centers))), random_state)
+
+    def __len__(self) -> int:
+        return len(self.centers)
+
+    @property
+    def exact(self) -> bool:
+        """Whether queries return the nearest center rather than an approximation."""
+        return self._group_centers is None or self.n_probe >= len(self._group_centers)
+
+    def _build_groups(self, n_groups: int, random_state: int):
+        grouping = KMeans(n_clusters=n_groups, n_init=1, random_state=random_state).fit(self.centers)
+        groups = grouping.labels_
+        self._group_centers = np.ascontiguousarray(grouping.cluster_centers_)
+        self._group_norms = _row_norms(self._group_centers)
+
+        # Members of each group are contiguous in _members, between consecutive offsets
+        self._members = np.argsort(groups, kind='stable')
+        self._offsets = np.searchsorted(groups[self._members], np.arange(n_groups + 1))
+
+    def query(self, X: np.ndarray,
+              return_distance: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+        """Index of the nearest center of each row of X, and optionally its squared distance."""
+        X = np.asarray(X, dtype=np.float64)
+        labels = np.empty(len(X), dtype=np.intp)
+        squared = np.empty(len(X), dtype=np.float64)
+
+        if not self.exact:
+            for start in range(0, len(X), GROUPED_BLOCK_ROWS):
+                block = slice(start, start + GROUPED_BLOCK_ROWS)
+                labels[block], squared[block] = self._query_groups(X[block])
+        else:
+            block_rows = max(1, BLOCK_BYTES // (8 * len(self.centers)))
+            for start in range(0, len(X), block_rows):
+                block = X[start:start + block_rows]
+                distances = _squared_distances(block, self.centers, self.norms)
+                block_labels = distances.argmin(axis=1)
+                labels[start:start + len(block)] = block_labels
+                squared[start:start + len(block)] = distances[np.arange(len(block)), block_labels]
+
+        if not return_distance:
+            return labels
+        # Add back the per-row constant, which does not change the nearest center
+        squared += _row_norms(X)
+        np.maximum(squared, 0, out=squared)
+        return labels, squared
+
+    def _query_groups(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Nearest centers among the n_probe nearest groups, with squared distances up to ||x||^2."""
+        n_groups = len(self._group_centers)
+        group_distances = _squared_distances(X, self._group_centers, self._group_norms)
+        probes = np.argpartition(group_distances, self.n_probe - 1, axis=1)[:, :self.n_probe]
+
+        labels = np.empty(len(X), dtype=np.intp)
+        best = np.full(len(X), np.inf)
+        for probe in probes.T:
+            # Rows probing the same group are compared with its members in one matrix product
+            order = np.argsort(probe, kind='stable')
+            row_offsets = np.searchsorted(probe[order], np.arange(n_groups + 1))
+            for group in range(n_groups):
+                rows = order[row_offsets[group]:row_offsets[group + 1]]
+                members = self._members[self._offsets[group]:self._offsets[group + 1]]
+                if len(rows) == 0 or len(members) == 0:
+                    continue
+                distances = _squared_distances(X[rows], self.centers[members], self.norms[members])
+                nearest = distances.argmin(axis=1)
+                nearest_distances = distances[np.arange(len(rows)), nearest]
+                closer = nearest_distances < best[rows]
+                labels[rows[closer]] = members[nearest[closer]]
+                best[rows[closer]] = nearest_distances[closer]
+        return labels, best
@@ -1,19 +1,93 @@
 from sklearn.preprocessing import StandardScaler, LabelEncoder
-from sklearn.cluster import KMeans
 from sklearn.metrics import silhouette_score
 import pandas as pd
 import numpy as np
-from typing import Dict, Tuple
-import joblib
-from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from joblib import Parallel, delayed, effective_n_jobs, parallel_backend
+import logging
+import os
+
+from app.instrumentation import StageTimings
+from app.models import profiling
+from app.models.backends import BACKENDS, ClusteringBackend, get_backend
+from app.models.scoring import CentroidIndex
+
+logger = logging.getLogger(__name__)
+
+def string_categorical(values: pd.Series) -> pd.Categorical:
+    """Categorical of the values as strings, the form the fitted vocabularies are kept in.
+    
+    Non-string categories, e.g. numeric codes, are renamed to their string forms; missing values
+    are a category of their own, as str(nan).
+    """
+    categorical = values.array if isinstance(values.dtype, pd.CategoricalDtype) else pd.Categorical(values)
+    names = [str(category) for category in categorical.categories]
+    if categorical.isna().any() or len(set(names)) < len(names):
+        return pd.Categorical(values.astype(str))
+    return categorical.rename_categories(names)
+
+def sampled_silhouette_score(X: np.ndarray, labels: np.ndarray, sample_size: Optional[int],
+                             random_state: int) -> float:
+    """Silhouette score, computed on a random sample of rows for large datasets."""
+    if sample_size and len(X) > sample_size:
+        return float(silhouette_score(X, labels, sample_size=sample_size, random_state=random_state))
+    return float(silhouette_score(X, labels))
+
+def fit_candidate(backend: ClusteringBackend, X: np.ndarray, n_clusters: int,
+                  silhouette_sample_size: Optional[int],
+                  init: Optional[np.ndarray] = None) -> Tuple[Any, float, List[Dict]]:
+    """Fit one candidate number of clusters.
+    
+    Returns the estimator, its silhouette score and the timings of the fit and the scoring. A
+    module-level function, so process pool workers receive only the backend and settings instead
+    of the whole segmentation and its progress callback.
+    """
+    timings = StageTimings()
+    with timings.stage('fit', rows=len(X), k=n_clusters, algorithm=backend.name):
+        estimator = backend.make_estimator(n_clusters, init)
+        cluster_labels = estimator.fit_predict(X)
+    sample_rows = min(len(X), silhouette_sample_size or len(X))
+    with timings.stage('silhouette', rows=sample_rows, k=n_clusters, algorithm=backend.name):
+        score = sampled_silhouette_score(X, cluster_labels, silhouette_sample_size, backend.random_state)
+    return estimator, score, timings.records
 
 class CustomerSegmentation:
-    def __init__(self):
+    # Clustering algorithms available for the cluster count search and the final model
+    ALGORITHMS = tuple(BACKENDS)
+    
+    def __init__(self, algorithm: str = 'kmeans', silhouette_sample_size: Optional[int] = 10000,
+                 warm_start: bool = False, n_jobs: int = 1, drift_threshold: float = 1.25,
+                 random_state: int = 42, min_clusters: int = 3, max_clusters: int = 8,
+                 scoring_probes: Optional[int] = None):
+        backend = get_backend(algorithm, random_state)
+        if warm_start and not backend.supports_init:
+            raise ValueError(f"warm_start is not supported by the {algorithm} algorithm")
+        if warm_start and n_jobs != 1:
+            raise ValueError("warm_start requires a sequential cluster count search (n_jobs=1)")
+        if not 2 <= min_clusters <= max_clusters:
+            raise ValueError(f"Expected 2 <= min_clusters <= max_clusters, got {min_clusters} and {max_clusters}")
+        
+        # Cluster count search settings
+        self.algorithm = algorithm
+        self.backend = backend
+        self.min_clusters = min_clusters
+        self.max_clusters = max_clusters
+        self.silhouette_sample_size = silhouette_sample_size
+        self.warm_start = warm_start
+        self.n_jobs = n_jobs
+        self.random_state = random_state
+        
+        # Incremental updates whose mean squared distance to the centers exceeds the training
+        # one by more than this factor call for a full refit
+        self.drift_threshold = drift_threshold
+        
+        # Groups of centers probed when assigning customers, or None for an exact assignment;
+        # only used with hundreds of clusters (see CentroidIndex)
+        self.scoring_probes = scoring_probes
+        
         self.scaler = StandardScaler()
         self.label_encoders = {}
         self.model = None
-        self.model_dir = Path("models")
-        self.model_dir.mkdir(exist_ok=True)
         
         # Segment description templates based on feature analysis
         self.segment_descriptions = {}  # Will be set after clustering
@@ -24,85 +98,148 @@ class CustomerSegmentation:
             'purchase_frequency', 'avg_order_value', 'customer_lifetime_value'
         ]
         self.categorical_features = ['gender', 'preferred_category']
-    
-    def _encode_categorical(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Encode categorical variables."""
-        df_encoded = df.copy()
+        self.engineered_features = ['avg_value_per_visit', 'engagement_score', 'value_score']
         
-        for feature in self.categorical_features:
-            if feature in df.columns:
-                le = LabelEncoder()
-                df_encoded[feature] = le.fit_transform(df_encoded[feature].astype(str))
-                self.label_encoders[feature] = le
-                
-        return df_encoded
-    
-    def _engineer_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Create new features from existing ones."""
-        df_engineered = df.copy()
+        # Fitted statistics used to transform new customers without refitting
+        self.fill_values = {}
+        self._feature_mean = None
+        self._feature_scale = None
+        self._category_codes = {}
+        self._centers = None
+        self._index: Optional[CentroidIndex] = None
+        self._cluster_sizes = None
+        self._inertia_per_row = None
+        self._silhouette = None
         
-        # Average value per visit
-        df_engineered['avg_value_per_visit'] = (df_engineered['customer_lifetime_value'] / 
-                                               (df_engineered['visits_per_month'] + 1))  # Add 1 to avoid division by zero
+        # Optional callback receiving (stage, **details) as segmentation progresses
+        self.progress_callback: Optional[Callable[..., None]] = None
         
-        # Engagement score
-        df_engineered['engagement_score'] = (df_engineered['visits_per_month'] * 0.3 + 
-                                           df_engineered['avg_time_spent'] * 0.3 +
-                                           df_engineered['purchase_frequency'] * 0.4)
+        # Duration, rows and allocations of each stage of the fit
+        self.timings = StageTimings()
+    
+    def _report(self, stage: str, **details):
+        """Report progress to the progress callback, if one is set."""
+        if self.progress_callback is not None:
+            self.progress_callback(stage, **details)
+    
+    @property
+    def input_columns(self) -> List[str]:
+        """Names of the raw data columns used by the model."""
+        return self.numeric_features + self.categorical_features
+    
+    @property
+    def clustering_features(self) -> List[str]:
+        """Names of the columns of the feature matrix, in order."""
+        return self.numeric_features + self.categorical_features + self.engineered_features
+    
+    def _fit_encoders(self, df: pd.DataFrame):
+        """Learn the missing value fills and category vocabularies of the training data."""
+        for col in self.numeric_features:
+            self.fill_values[col] = float(df[col].median())
         
-        # Value score
-        df_engineered['value_score'] = (df_engineered['avg_order_value'] * 0.4 +
-                                       df_engineered['customer_lifetime_value'] * 0.6)
+        for feature in self.categorical_features:
+            categorical = string_categorical(df[feature])
+            le = LabelEncoder()
+            le.classes_ = np.array(sorted(categorical.remove_unused_categories().categories), dtype=object)
+            self.label_encoders[feature] = le
+    
+    def _silhouette_score(self, X: np.ndarray, labels: np.ndarray) -> float:
+        """Silhouette score, computed on a random sample of rows for large datasets."""
+        return sampled_silhouette_score(X, labels, self.silhouette_sample_size, self.random_state)
+    
+    def _warm_start_centers(self, X: np.ndarray, centers: np.ndarray) -> np.ndarray:
+        """Initial centers for k + 1 clusters: the fitted k centers plus the point farthest from them."""
+        rng = np.random.RandomState(self.random_state)
+        sample = X if len(X) <= 10000 else X[rng.choice(len(X), 10000, replace=False)]
+        _, distances = CentroidIndex(centers).query(sample, return_distance=True)
+        return np.vstack([centers, sample[np.argmax(distances)]])
+    
+    def _fit_candidate(self, X: np.ndarray, n_clusters: int,
+                       init: Optional[np.ndarray] = None) -> Tuple[Any, float, List[Dict]]:
+        """Fit one candidate number of clusters (see fit_candidate)."""
+        return fit_candidate(self.backend, X, n_clusters, self.silhouette_sample_size, init)
+    
+    def _fit_candidates_parallel(self, X: np.ndarray,
+                                 candidates: List[int]) -> List[Tuple[Any, float, List[Dict]]]:
+        """Fit all candidate numbers of clusters concurrently in a process pool.
         
-        return df_engineered
+        X is memory-mapped into the workers by joblib instead of being pickled to each of them,
+        and the native thread pools of each worker are sized so the workers share the cores.
+        Progress is reported from this process as each candidate finishes.
+        """
+        n_workers = min(effective_n_jobs(self.n_jobs), len(candidates))
+        inner_threads = max(1, (os.cpu_count() or 1) // n_workers)
+        results = []
+        with parallel_backend('loky', inner_max_num_threads=inner_threads):
+            fits = Parallel(n_jobs=n_workers, max_nbytes='1M', mmap_mode='r', return_as='generator')(
+                delayed(fit_candidate)(self.backend, X, n_clusters, self.silhouette_sample_size)
+                for n_clusters in candidates
+            )
+            for n_clusters, result in zip(candidates, fits):
+                results.append(result)
+                self._report('evaluating_clusters', n_clusters=n_clusters, candidates=candidates,
+                             completed=len(results))
+        return results
     
-    def _determine_optimal_clusters(self, X: np.ndarray, max_clusters: int = 8) -> int:
-        """Determine optimal number of clusters using silhouette score."""
+    def _determine_optimal_clusters(self, X: np.ndarray) -> int:
+        """Determine optimal number of clusters between min_clusters and max_clusters using silhouette score.
+        
+        The winning estimator is kept in self.model so it does not have to be refitted.
+        """
         best_score = -1
         best_n_clusters = 4  # Default
         
-        for n_clusters in range(3, max_clusters + 1):
-            kmeans = KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
-            cluster_labels = kmeans.fit_predict(X)
-            silhouette_avg = silhouette_score(X, cluster_labels)
-            
+        # The silhouette score needs fewer clusters than customers
+        candidates = list(range(self.min_clusters, min(self.max_clusters, len(X) - 1) + 1))
+        if not candidates:
+            raise ValueError(f"Not enough customers ({len(X)}) for {self.min_clusters} segments")
+        
+        if self.n_jobs != 1:
+            self._report('evaluating_clusters', candidates=candidates)
+            results = self._fit_candidates_parallel(X, candidates)
+        else:
+            results = []
+            init = None
+            for n_clusters in candidates:
+                self._report('evaluating_clusters', n_clusters=n_clusters, candidates=candidates)
+                result = self._fit_candidate(X, n_clusters, init)
+                results.append(result)
+                if self.warm_start:
+                    init = self._warm_start_centers(X, result[0].cluster_centers_)
+        
+        for n_clusters, (estimator, silhouette_avg, timings) in zip(candidates, results):
+            self.timings.extend(timings)
             if silhouette_avg > best_score:
                 best_score = silhouette_avg
                 best_n_clusters = n_clusters
+                self.model = estimator
+                self._silhouette = silhouette_avg
         
         return best_n_clusters
     
-    def _generate_segment_descriptions(self, df: pd.DataFrame, df_engineered: pd.DataFrame) -> Dict:
+    def _generate_segment_descriptions(self, segment_means: pd.DataFrame, overall_means: pd.Series) -> Dict:
         """Generate detailed segment descriptions based on cluster characteristics."""
         descriptions = {}
         
-        for segment in df['segment'].unique():
-            segment_data = df[df['segment'] == segment]
-            segment_data_eng = df_engineered[df['segment'] == segment]
-            
-            # Calculate key metrics
-            avg_value = segment_data['customer_lifetime_value'].mean()
-            avg_frequency = segment_data['purchase_frequency'].mean()
-            avg_engagement = segment_data_eng['engagement_score'].mean()
-            
+        for segment, means in segment_means.iterrows():
             # Determine segment characteristics
-            if avg_value > df['customer_lifetime_value'].mean() * 1.2:
+            if means['customer_lifetime_value'] > overall_means['customer_lifetime_value'] * 1.2:
                 value_level = "high-value"
-            elif avg_value < df['customer_lifetime_value'].mean() * 0.8:
+            elif means['customer_lifetime_value'] < overall_means['customer_lifetime_value'] * 0.8:
                 value_level = "budget-conscious"
             else:
                 value_level = "mid-tier"
                 
-            if avg_frequency > df['purchase_frequency'].mean() * 1.2:
+            if means['purchase_frequency'] > overall_means['purchase_frequency'] * 1.2:
                 frequency_level = "frequent"
-            elif avg_frequency < df['purchase_frequency'].mean() * 0.8:
+            elif means['purchase_frequency'] < overall_means['purchase_frequency'] * 0.8:
                 frequency_level = "infrequent"
             else:
                 frequency_level = "regular"
                 
-            if avg_engagement > df_engineered['engagement_score'].mean() * 1.2:
+            if means['engagement_score'] > overall_means['engagement_score'] * 1.2:
                 engagement_level = "highly engaged"
-            elif avg_engagement < df_engineered['engagement_score'].mean() * 0.8:
+            elif means['engagement_score'] < overall_means['engagement_score'] * 0.8:
                 engagement_level = "low engagement"
             else:
                 engagement_level = "moderately engaged"
@@ -112,125 +249,346 @@ class CustomerSegmentation:
             
         return descriptions
     
-    def preprocess_data(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
-        """Preprocess data for clustering."""
-        df_processed = df.copy()
+    def preprocess_data(self, df: pd.DataFrame) -> np.ndarray:
+        """Preprocess data for clustering into a single scaled feature matrix.
         
-        # Handle missing values
-        for col in self.numeric_features:
-            if df_processed[col].isnull().any():
-                df_processed[col] = df_processed[col].fillna(df_processed[col].median())
+        The features are written straight into one preallocated array and scaled in place, so
+        peak memory stays at about one copy of the features instead of several copies of df.
+        """
+        self._fit_encoders(df)
+        X = self._feature_matrix(df)
         
-        # Encode categorical variables
-        df_processed = self._encode_categorical(df_processed)
+        # Fit the scaler statistics and scale in place
+        n_samples = len(X)
+        mean = X.mean(axis=0)
+        X -= mean
+        var = np.einsum('ij,ij->j', X, X) / n_samples
+        scale = np.sqrt(var)
+        scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+        X /= scale
         
-        # Engineer features
-        df_engineered = self._engineer_features(df_processed)
+        self.scaler.mean_, self.scaler.var_, self.scaler.scale_ = mean, var, scale
+        self.scaler.n_samples_seen_ = np.int64(n_samples)
+        self.scaler.n_features_in_ = X.shape[1]
+        return X
+    
+    def _generate_insights(self, df: pd.DataFrame, X: np.ndarray, labels: np.ndarray, n_clusters: int) -> Dict:
+        """Describe and profile the segments of customers with one grouped pass over the data.
         
-        # Select features for clustering
-        features_for_clustering = (self.numeric_features + 
-                                 self.categorical_features + 
-                                 ['avg_value_per_visit', 'engagement_score', 'value_score'])
+        X is the scaled feature matrix of df, which provides the engagement and value scores.
+        """
+        self._report('profiling', n_clusters=n_clusters)
         
-        # Scale the features
-        df_engineered[features_for_clustering] = self.scaler.fit_transform(
-            df_engineered[features_for_clustering]
-        )
+        # Per-segment means of the profiled metrics, plus their overall means; both skip missing
+        # values, so a few gaps in a column do not make every segment compare as mid-tier
+        metrics = {col: df[col].to_numpy() for col in self.numeric_features}
+        features = self.clustering_features
+        metrics['engagement_score'] = X[:, features.index('engagement_score')]
+        metrics['value_score'] = X[:, features.index('value_score')]
+        segment_means = profiling.segment_numeric_stats(labels, metrics, n_clusters).droplevel(1, axis=1)
+        overall_means = pd.Series({col: np.nanmean(values) for col, values in metrics.items()})
+        sizes = profiling.segment_sizes(labels, n_clusters)
+        categories = profiling.segment_value_counts(labels, df['preferred_category'], n_clusters)
+        genders = profiling.segment_value_counts(labels, df['gender'], n_clusters)
+        
+        # Generate segment descriptions
+        self.segment_descriptions = self._generate_segment_descriptions(segment_means, overall_means)
+        
+        # Generate insights
+        insights = {
+            'segment_sizes': profiling.top_values(pd.Series(sizes)),
+            'segment_profiles': {},
+            'model_info': {
+                'algorithm': self.algorithm,
+                'n_clusters': n_clusters,
+                'silhouette_score': self._silhouette,
+                'features_used': self.clustering_features
+            }
+        }
         
-        return df_engineered[features_for_clustering], df_engineered
+        # Calculate segment profiles
+        for segment in range(n_clusters):
+            means = segment_means.loc[segment]
+            insights['segment_profiles'][f'Segment_{segment}'] = {
+                'label': self.segment_descriptions[segment],
+                'size': int(sizes[segment]),
+                'percentage': round(sizes[segment] / len(df) * 100, 2),
+                'avg_metrics': {
+                    col: round(float(means[col]), 2)
+                    for col in self.numeric_features
+                },
+                'engagement_metrics': {
+                    'avg_engagement_score': round(float(means['engagement_score']), 2),
+                    'avg_value_score': round(float(means['value_score']), 2)
+                },
+                'top_categories': profiling.top_values(categories.loc[segment], 3),
+                'gender_distribution': profiling.top_values(genders.loc[segment], normalize=True)
+            }
+        
+        return insights
     
-    def segment_customers(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Dict]:
-        """Segment customers and generate insights."""
+    def segment_customers(self, df: pd.DataFrame) -> Tuple[np.ndarray, Dict]:
+        """Segment customers and generate insights. Returns the segment of each row of df.
+        
+        df is not modified, so it can be shared with concurrent readers.
+        """
         try:
             # Preprocess data
-            df_processed, df_engineered = self.preprocess_data(df)
+            self._report('preprocessing', rows=len(df))
+            with self.timings.stage('preprocessing', rows=len(df)):
+                X = self.preprocess_data(df)
             
-            # Determine optimal number of clusters
-            n_clusters = self._determine_optimal_clusters(df_processed.values)
+            # Determine optimal number of clusters, keeping the winning model
+            with self.timings.stage('cluster_search', rows=len(X)):
+                n_clusters = self._determine_optimal_clusters(X)
+            labels = self.model.labels_
+            self._build_inference_state()
             
-            # Initialize and fit the model with optimal clusters
-            self.model = KMeans(n_clusters=n_clusters, n_init=10, random_state=42)
-            clusters = self.model.fit_predict(df_processed)
-            df['segment'] = clusters
+            # Generate segment descriptions and insights
+            with self.timings.stage('profiling', rows=len(df)):
+                insights = self._generate_insights(df, X, labels, n_clusters)
             
-            # Generate segment descriptions
-            self.segment_descriptions = self._generate_segment_descriptions(df, df_engineered)
-            
-            # Generate insights
-            insights = {
-                'segment_sizes': df['segment'].value_counts().to_dict(),
-                'segment_profiles': {},
-                'model_info': {
-                    'algorithm': 'kmeans',
-                    'n_clusters': n_clusters,
-                    'silhouette_score': float(silhouette_score(df_processed, clusters)),
-                    'features_used': list(df_processed.columns)
-                }
-            }
-            
-            # Calculate segment profiles
-            for segment in range(n_clusters):
-                segment_data = df[df['segment'] == segment]
-                segment_data_eng = df_engineered[df['segment'] == segment]
-                
-                insights['segment_profiles'][f'Segment_{segment}'] = {
-                    'label': self.segment_descriptions[segment],
-                    'size': len(segment_data),
-                    'percentage': round(len(segment_data) / len(df) * 100, 2),
-                    'avg_metrics': {
-                        col: round(float(segment_data[col].mean()), 2)
-                        for col in self.numeric_features
-                    },
-                    'engagement_metrics': {
-                        'avg_engagement_score': round(float(segment_data_eng['engagement_score'].mean()), 2),
-                        'avg_value_score': round(float(segment_data_eng['value_score'].mean()), 2)
-                    },
-                    'top_categories': segment_data['preferred_category'].value_counts().head(3).to_dict(),
-                    'gender_distribution': segment_data['gender'].value_counts(normalize=True).to_dict()
-                }
-            
-            # Save the model
-            self._save_models()
-            
-            return df, insights
+            return labels, insights
             
         except Exception as e:
-            print(f"Error in segment_customers: {str(e)}")
+            logger.error(f"Error in segment_customers: {str(e)}")
             raise
     
+    def _build_inference_state(self):
+        """Precompute the arrays used to transform and score customers after a fit."""
+        self._centers = np.asarray(self.model.cluster_centers_, dtype=np.float64)
+        self._cluster_sizes = np.bincount(self.model.labels_, minlength=len(self._centers))
+        self._inertia_per_row = float(self.model.inertia_) / len(self.model.labels_)
+        self._index_fitted_statistics()
+    
+    def _index_fitted_statistics(self):
+        """Derive the lookup arrays used for scoring from the scaler, encoders and centers."""
+        self._feature_mean = np.asarray(self.scaler.mean_, dtype=np.float64)
+        self._feature_scale = np.asarray(self.scaler.scale_, dtype=np.float64)
+        self._category_codes = {
+            feature: {category: code for code, category in enumerate(le.classes_)}
+            for feature, le in self.label_encoders.items()
+        }
+        self._index = CentroidIndex(self._centers, n_probe=self.scoring_probes)
+    
+    def get_state(self) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+        """Arrays and JSON-serializable parameters needed to score customers without refitting."""
+        if self._centers is None:
+            raise ValueError("No trained model found. Please run segmentation first.")
+        arrays = {
+            'centers': self._centers,
+            'cluster_sizes': self._cluster_sizes,
+            'feature_mean': np.asarray(self.scaler.mean_, dtype=np.float64),
+            'feature_var': np.asarray(self.scaler.var_, dtype=np.float64),
+            'feature_scale': np.asarray(self.scaler.scale_, dtype=np.float64),
+        }
+        params = {
+            'algorithm': self.algorithm,
+            'silhouette_sample_size': self.silhouette_sample_size,
+            'drift_threshold': self.drift_threshold,
+            'random_state': self.random_state,
+            'min_clusters': self.min_clusters,
+            'max_clusters': self.max_clusters,
+            'scoring_probes': self.scoring_probes,
+            'n_samples_seen': int(self.scaler.n_samples_seen_),
+            'fill_values': self.fill_values,
+            'vocabularies': {feature: [str(c) for c in le.classes_] for feature, le in self.label_encoders.items()},
+            'segment_descriptions': [self.segment_descriptions[segment] for segment in range(len(self._centers))],
+            'silhouette_score': None if self._silhouette is None else float(self._silhouette),
+            'inertia_per_row': self._inertia_per_row,
+        }
+        return arrays, params
+    
+    @classmethod
+    def from_state(cls, arrays: Dict[str, np.ndarray], params: Dict[str, Any]) -> "CustomerSegmentation":
+        """Rebuild a fitted segmentation from the output of get_state, ready to score customers."""
+        segmentation = cls(
+            algorithm=params['algorithm'],
+            silhouette_sample_size=params['silhouette_sample_size'],
+            drift_threshold=params['drift_threshold'],
+            random_state=params['random_state'],
+            min_clusters=params.get('min_clusters', 3),
+            max_clusters=params.get('max_clusters', 8),
+            scoring_probes=params.get('scoring_probes')
+        )
+        scaler = segmentation.scaler
+        scaler.mean_, scaler.var_ = arrays['feature_mean'], arrays['feature_var']
+        scaler.scale_ = arrays['feature_scale']
+        scaler.n_samples_seen_ = np.int64(params['n_samples_seen'])
+        scaler.n_features_in_ = len(scaler.mean_)
+        for feature, vocabulary in params['vocabularies'].items():
+            le = LabelEncoder()
+            le.classes_ = np.array(vocabulary, dtype=object)
+            segmentation.label_encoders[feature] = le
+        
+        segmentation.fill_values = params['fill_values']
+        segmentation.segment_descriptions = dict(enumerate(params['segment_descriptions']))
+        segmentation._silhouette = params['silhouette_score']
+        segmentation._inertia_per_row = params['inertia_per_row']
+        segmentation._centers = arrays['centers']
+        segmentation._cluster_sizes = arrays['cluster_sizes']
+        segmentation._index_fitted_statistics()
+        return segmentation
+    
+    def transform(self, customer_data: Dict[str, Any]) -> np.ndarray:
+        """Transform a single customer into a scaled feature vector using the fitted statistics."""
+        if self._centers is None:
+            raise ValueError("No trained model found. Please run segmentation first.")
+        
+        n_numeric = len(self.numeric_features)
+        row = np.empty(len(self.clustering_features), dtype=np.float64)
+        
+        # Numeric features, falling back to the training medians
+        for i, feature in enumerate(self.numeric_features):
+            value = customer_data.get(feature)
+            row[i] = self.fill_values[feature] if value is None or value != value else float(value)
+        
+        # Categorical features, using the training vocabularies
+        for i, feature in enumerate(self.categorical_features):
+            value = customer_data.get(feature)
+            codes = self._category_codes[feature]
+            code = codes.get(str(value))
+            if code is None and isinstance(value, (int, float, np.number)) and float(value).is_integer():
+                # Numeric codes match whether they are given or were trained as integers or floats
+                code = codes.get(str(int(value)), codes.get(str(float(value))))
+            if code is None:
+                raise ValueError(f"Unknown value for {feature}: {str(value)!r}")
+            row[n_numeric + i] = code
+        
+        # Engineered features, as in _feature_matrix
+        values = dict(zip(self.numeric_features, row))
+        offset = n_numeric + len(self.categorical_features)
+        row[offset] = values['customer_lifetime_value'] / (values['visits_per_month'] + 1)
+        row[offset + 1] = (values['visits_per_month'] * 0.3 +
+                           values['avg_time_spent'] * 0.3 +
+                           values['purchase_frequency'] * 0.4)
+        row[offset + 2] = values['avg_order_value'] * 0.4 + values['customer_lifetime_value'] * 0.6
+        
+        # Scale in place with the fitted scaler statistics
+        row -= self._feature_mean
+        row /= self._feature_scale
+        return row
+    
+    def predict(self, customer_data: Dict[str, Any]) -> int:
+        """Assign a single customer to the nearest fitted cluster center."""
+        row = self.transform(customer_data)
+        return int(self._index.query(row[None, :])[0])
+    
+    def _feature_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """Build the unscaled feature matrix of customers in one preallocated array.
+        
+        Uses the fill values and vocabularies learned by _fit_encoders.
+        """
+        missing_columns = [col for col in self.numeric_features + self.categorical_features
+                           if col not in df.columns]
+        if missing_columns:
+            raise ValueError(f"Missing required columns: {missing_columns}")
+        
+        n_numeric = len(self.numeric_features)
+        X = np.empty((len(df), len(self.clustering_features)), dtype=np.float64)
+        
+        # Numeric features, falling back to the training medians
+        for i, feature in enumerate(self.numeric_features):
+            column = X[:, i]
+            column[:] = pd.to_numeric(df[feature]).to_numpy(dtype=np.float64)
+            column[np.isnan(column)] = self.fill_values[feature]
+        
+        # Categorical features, using the training vocabularies
+        for i, feature in enumerate(self.categorical_features):
+            categorical = string_categorical(df[feature])
+            codes = categorical.set_categories(self.label_encoders[feature].classes_).codes
+            if (codes < 0).any():
+                unknown = sorted(set(np.asarray(categorical)[codes < 0]))
+                raise ValueError(f"Unknown values for {feature}: {unknown}")
+            X[:, n_numeric + i] = codes
+        
+        # Engineered features: value per visit, engagement score and value score
+        column = dict(zip(self.numeric_features, X.T))
+        offset = n_numeric + len(self.categorical_features)
+        np.divide(column['customer_lifetime_value'], column['visits_per_month'] + 1, out=X[:, offset])
+        X[:, offset + 1] = (column['visits_per_month'] * 0.3 +
+                            column['avg_time_spent'] * 0.3 +
+                            column['purchase_frequency'] * 0.4)
+        X[:, offset + 2] = column['avg_order_value'] * 0.4 + column['customer_lifetime_value'] * 0.6
+        return X
+    
+    def transform_batch(self, df: pd.DataFrame) -> np.ndarray:
+        """Transform a batch of customers into a scaled feature matrix using the fitted statistics."""
+        if self._centers is None:
+            raise ValueError("No trained model found. Please run segmentation first.")
+        X = self._feature_matrix(df)
+        
+        # Scale in place with the fitted scaler statistics
+        X -= self._feature_mean
+        X /= self._feature_scale
+        return X
+    
+    def predict_batch(self, df: pd.DataFrame) -> np.ndarray:
+        """Assign every customer in a batch to the nearest fitted cluster center."""
+        X = self.transform_batch(df)
+        return self._index.query(X)
+    
+    def partial_fit(self, df: pd.DataFrame) -> Tuple[np.ndarray, float]:
+        """Update the fitted scaler and cluster centers with new customers.
+        
+        The scaler statistics are updated with the new rows and each center moves to the mean of
+        its previous members and the new rows assigned to it (a mini-batch k-means step). Returns
+        the segments of the new customers and the drift: their mean squared distance to their
+        center relative to that of the training data. Raises ValueError for categories unseen
+        during the fit, and for backends whose centers cannot be updated this way, which also call
+        for a full refit.
+        """
+        if self._centers is None:
+            raise ValueError("No trained model found. Please run segmentation first.")
+        if not self.backend.supports_partial_fit:
+            raise ValueError(f"{self.backend.name} models cannot be updated incrementally")
+        X = self._feature_matrix(df)
+        
+        # Move the centers to the unscaled space, update the scaler, then rescale both
+        centers = self._centers * self._feature_scale + self._feature_mean
+        self.scaler.partial_fit(X)
+        self._feature_mean = np.asarray(self.scaler.mean_, dtype=np.float64)
+        self._feature_scale = np.asarray(self.scaler.scale_, dtype=np.float64)
+        centers -= self._feature_mean
+        centers /= self._feature_scale
+        X -= self._feature_mean
+        X /= self._feature_scale
+        
+        # Assign the new customers and measure how well the current centers fit them
+        labels, squared_distances = CentroidIndex(centers).query(X, return_distance=True)
+        drift = float(squared_distances.mean()) / self._inertia_per_row if len(X) else 0.0
+        
+        # Incremental mean update of each center with its new members
+        counts = np.bincount(labels, minlength=len(centers))
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, X)
+        sizes = self._cluster_sizes + counts
+        updated = counts > 0
+        centers[updated] = ((centers[updated] * self._cluster_sizes[updated, None] + sums[updated]) /
+                            sizes[updated, None])
+        
+        self._centers = centers
+        self._index = CentroidIndex(centers, n_probe=self.scoring_probes)
+        self._cluster_sizes = sizes
+        if self.model is not None:
+            self.model.cluster_centers_ = centers.copy()
+        return labels, drift
+    
+    def describe_segments(self, df: pd.DataFrame, labels: np.ndarray) -> Dict:
+        """Generate insights for customers already assigned to segments, without refitting."""
+        with self.timings.stage('preprocessing', rows=len(df)):
+            X = self.transform_batch(df)
+        with self.timings.stage('silhouette', rows=min(len(X), self.silhouette_sample_size or len(X))):
+            self._silhouette = self._silhouette_score(X, labels)
+        with self.timings.stage('profiling', rows=len(df)):
+            return self._generate_insights(df, X, labels, len(self._centers))
+    
     def predict_segment(self, customer_data: Dict) -> Tuple[int, str]:
         """Predict segment for a single customer."""
         try:
-            # Create DataFrame with single customer
-            df = pd.DataFrame([customer_data])
-            
-            # Preprocess the data
-            df_processed, _ = self.preprocess_data(df)
-            
-            # Predict segment
-            segment = int(self.model.predict(df_processed)[0])
-            
+            segment = self.predict(customer_data)
             return segment, self.segment_descriptions[segment]
             
         except Exception as e:
-            print(f"Error in predict_segment: {str(e)}")
+            logger.error(f"Error in predict_segment: {str(e)}")
             raise
-    
-    def _save_models(self):
-        """Save models to disk."""
-        try:
-            joblib.dump(self.model, self.model_dir / 'kmeans_model.joblib')
-            joblib.dump(self.scaler, self.model_dir / 'scaler.joblib')
-            joblib.dump(self.label_encoders, self.model_dir / 'label_encoders.joblib')
-        except Exception as e:
-            print(f"Warning: Could not save models: {str(e)}")
-    
-    def _load_models(self):
-        """Load models from disk."""
-        try:
-            self.model = joblib.load(self.model_dir / 'kmeans_model.joblib')
-            self.scaler = joblib.load(self.model_dir / 'scaler.joblib')
-            self.label_encoders = joblib.load(self.model_dir / 'label_encoders.joblib')
-        except Exception as e:
-            print(f"Warning: Could not load models: {str(e)}")
-            raise ValueError("No trained model found. Please run segmentation first.") 
\ No newline at end of file
@@ -0,0 +1,42 @@
+from typing import Any, Dict
+
+import numpy as np
+import orjson
+from fastapi.responses import JSONResponse
+
+# Numpy arrays and scalars are serialized natively; int dict keys become strings like with json
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(value: Any) -> Any:
+    """Convert values orjson does not serialize natively, e.g. non-contiguous arrays."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    """Serialize content with numpy values to JSON in a single pass. NaN and infinity become null."""
+    return orjson.dumps(content, default=_default, option=OPTIONS)
+
+
+def dumps_with_json(content: Dict[str, Any], **members: bytes) -> bytes:
+    """Serialize a dict with further members whose values are already serialized, placed first."""
+    body = dumps(content)
+    if not members:
+        return body
+    prefix = b",".join(dumps(key) + b":" + value for key, value in members.items())
+    return b"{" + prefix + (b"," if content else b"") + body[1:]
+
+
+class NumpyJSONResponse(JSONResponse):
+    """JSON response that serializes numpy-typed payloads directly, without converting them first.
+
+    Endpoints should return an instance rather than a dict: FastAPI runs returned dicts through
+    jsonable_encoder, which copies the whole payload and rejects numpy values.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,478 @@
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from app.locks import FileLock
+from app.summary import DatasetSummary
+
+logger = logging.getLogger(__name__)
+
+# Rows per chunk when converting CSV files into columns
+CHUNK_ROWS = 100000
+
+
+class Dataset:
+    """A read-only, memory-mapped version of the customer data stored column by column."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        with open(path / "manifest.json") as f:
+            self.manifest = json.load(f)
+        self._columns = {column["name"]: column for column in self.manifest["columns"]}
+        self._summary: Optional[DatasetSummary] = None
+        self._summary_dict: Optional[Dict] = None
+
+    @property
+    def fingerprint(self) -> str:
+        return self.manifest["fingerprint"]
+
+    @property
+    def num_rows(self) -> int:
+        return self.manifest["rows"]
+
+    @property
+    def columns(self) -> List[str]:
+        return [column["name"] for column in self.manifest["columns"]]
+
+    def is_categorical(self, name: str) -> bool:
+        return self._columns[name]["kind"] == "categorical"
+
+    def categories(self, name: str) -> List[str]:
+        return self._columns[name]["categories"]
+
+    def column(self, name: str) -> np.ndarray:
+        """Memory-map one column. Categorical columns are returned as their integer codes."""
+        if name not in self._columns:
+            raise KeyError(f"Column {name!r} not found in dataset")
+        column = self._columns[name]
+        if self.num_rows == 0:
+            return np.empty(0, dtype=column["dtype"])
+        return np.memmap(self.path / column["file"], dtype=column["dtype"], mode="r", shape=(self.num_rows,))
+
+    def series(self, name: str, rows: Optional[Union[np.ndarray, slice]] = None) -> pd.Series:
+        """Load one column as a Series, optionally only the given rows."""
+        values = self.column(name)
+        if rows is not None:
+            values = values[rows]
+        if self.is_categorical(name):
+            return pd.Series(pd.Categorical.from_codes(values, categories=self.categories(name)), name=name)
+        return pd.Series(values, name=name)
+
+    def load(self, columns: Optional[List[str]] = None,
+             rows: Optional[Union[np.ndarray, slice]] = None) -> pd.DataFrame:
+        """Load the given columns (all by default) into a DataFrame without parsing any CSV."""
+        columns = self.columns if columns is None else columns
+        return pd.DataFrame({name: self.series(name, rows) for name in columns})
+
+    def filter_rows(self, ranges: Dict[str, Tuple[Optional[float], Optional[float]]],
+                    rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Rows whose numeric columns lie within the given inclusive (min, max) ranges.
+
+        Only the given rows are read and kept, in order, when rows is set; missing values never match.
+        """
+        for name, (low, high) in ranges.items():
+            values = self.column(name) if rows is None else self.column(name)[rows]
+            mask = np.ones(len(values), dtype=bool)
+            if low is not None:
+                mask &= values >= low
+            if high is not None:
+                mask &= values <= high
+            rows = np.flatnonzero(mask) if rows is None else rows[mask]
+        return np.arange(self.num_rows) if rows is None else rows
+
+    def summary(self) -> DatasetSummary:
+        """Summary statistics computed at ingest, rebuilt from the columns for older versions."""
+        if self._summary is None:
+            summary = DatasetSummary.load(self.path)
+            if summary is None:
+                summary = DatasetSummary([(column["name"], column["kind"]) for column in self.manifest["columns"]])
+                for chunk in self.iter_chunks():
+                    summary.rows += len(chunk)
+                    for name in self.columns:
+                        summary.update(name, chunk[name] if self.is_categorical(name) else chunk[name].to_numpy())
+                summary.save(self.path)
+            self._summary = summary
+        return self._summary
+
+    def summary_dict(self) -> Dict:
+        """The rendered summary served by /data-summary/."""
+        if self._summary_dict is None:
+            self._summary_dict = self.summary().to_dict()
+        return self._summary_dict
+
+    def iter_chunks(self, columns: Optional[List[str]] = None,
+                    chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        """Yield the given columns as DataFrames of at most chunk_rows rows."""
+        for start in range(0, self.num_rows, chunk_rows):
+            chunk = self.load(columns, slice(start, start + chunk_rows))
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            yield chunk
+
+
+class SegmentIndex:
+    """Row ids of the customers of each segment, as one array sorted by segment plus offsets.
+
+    The rows of segment s are rows[offsets[s]:offsets[s + 1]], in increasing order, so a page of
+    a segment reads only its own rows from the column files.
+    """
+
+    def __init__(self, rows: np.ndarray, offsets: np.ndarray):
+        self.rows = rows
+        self.offsets = offsets
+
+    @classmethod
+    def build(cls, labels: np.ndarray, n_segments: int) -> "SegmentIndex":
+        rows = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[rows], np.arange(n_segments + 1))
+        return cls(rows, offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def segment(self, segment: int) -> np.ndarray:
+        """Row ids of one segment."""
+        return self.rows[self.offsets[segment]:self.offsets[segment + 1]]
+
+
+def _is_numeric(dtype) -> bool:
+    return pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def _number_strings(values: np.ndarray) -> List[Optional[str]]:
+    """Text of numeric values as it would have been read from CSV, with None for missing values."""
+    if values.dtype.kind in "iu":
+        return [str(value) for value in values.tolist()]
+    return [None if value != value else str(int(value)) if value.is_integer() else str(value)
+            for value in values.tolist()]
+
+
+class ColumnWriter:
+    """Builds a new dataset version from DataFrame chunks.
+
+    Numeric columns are stored as raw int64/float64 arrays and text columns as int32 codes into
+    a sorted vocabulary. The schema is taken from the first chunk and enforced on the others;
+    integer columns are promoted to float if a later chunk has missing or fractional values, and
+    numeric columns other than numeric_columns are demoted to text if a later chunk is not numeric.
+
+    Given a base dataset, the new version starts as a copy of it and the chunks are appended
+    to its rows and vocabularies. Statistics of the appended rows are merged into the summary of
+    the base on commit.
+    """
+
+    def __init__(self, store: "ColumnStore", numeric_columns: Sequence[str] = (),
+                 base: Optional[Dataset] = None):
+        self.store = store
+        self.numeric_columns = set(numeric_columns)
+        self.path = store.root / f"tmp-{uuid.uuid4().hex}"
+        self.path.mkdir(parents=True)
+        self.rows = 0
+        self._columns: List[Dict] = []
+        self._vocabularies: Dict[str, Dict[str, int]] = {}
+        self._files = {}
+        self.summary = DatasetSummary([])
+        self._base_summary: Optional[DatasetSummary] = None
+        if base is not None:
+            self._init_from_base(base)
+
+    def _init_from_base(self, base: Dataset):
+        base.summary()  # make sure the base has a saved summary to start from
+        for column in base.manifest["columns"]:
+            column = {key: value for key, value in column.items() if key != "categories"}
+            shutil.copyfile(base.path / column["file"], self.path / column["file"])
+            if column["kind"] == "categorical":
+                self._vocabularies[column["name"]] = {
+                    category: code for code, category in enumerate(base.categories(column["name"]))
+                }
+            self._columns.append(column)
+            self._files[column["name"]] = open(self.path / column["file"], "ab")
+        self.rows = base.num_rows
+        self._base_summary = DatasetSummary.load(base.path)
+        self.summary = DatasetSummary(self._base_summary.columns)
+
+    def _init_schema(self, chunk: pd.DataFrame):
+        for i, name in enumerate(chunk.columns):
+            dtype = chunk[name].dtype
+            if not _is_numeric(dtype):
+                if name in self.numeric_columns:
+                    raise ValueError(f"Column {name!r} must be numeric, found {dtype} values")
+                column = {"name": name, "kind": "categorical", "dtype": "int32"}
+                self._vocabularies[name] = {}
+            elif pd.api.types.is_integer_dtype(dtype):
+                column = {"name": name, "kind": "numeric", "dtype": "int64"}
+            else:
+                column = {"name": name, "kind": "numeric", "dtype": "float64"}
+            column["file"] = f"{i:03d}.bin"
+            self._columns.append(column)
+            self._files[name] = open(self.path / column["file"], "wb")
+        self.summary = DatasetSummary([(column["name"], column["kind"]) for column in self._columns])
+
+    def _promote_to_float(self, column: Dict):
+        """Rewrite an integer column written so far as float64, one block at a time."""
+        path = self.path / column["file"]
+        self._files[column["name"]].close()
+        with open(path, "rb") as src, open(path.with_suffix(".tmp"), "wb") as dst:
+            while True:
+                block = np.fromfile(src, dtype=np.int64, count=CHUNK_ROWS)
+                if not block.size:
+                    break
+                block.astype(np.float64).tofile(dst)
+        os.replace(path.with_suffix(".tmp"), path)
+        self._files[column["name"]] = open(path, "ab")
+        column["dtype"] = "float64"
+
+    def _demote_to_categorical(self, column: Dict):
+        """Rewrite a numeric column written so far as codes of its values' text, one block at a time."""
+        name = column["name"]
+        path = self.path / column["file"]
+        dtype = column["dtype"]
+        self._files[name].close()
+        column.update(kind="categorical", dtype="int32")
+        self._vocabularies[name] = {}
+        # The statistics of the rows written so far, including those of a base, are recomputed
+        self.summary.reset_column(name, "categorical")
+        if self._base_summary is not None:
+            self._base_summary.reset_column(name, "categorical")
+        with open(path, "rb") as src, open(path.with_suffix(".tmp"), "wb") as dst:
+            while True:
+                block = np.fromfile(src, dtype=dtype, count=CHUNK_ROWS)
+                if not block.size:
+                    break
+                values = pd.Series(_number_strings(block), dtype=object)
+                self._categorical_codes(column, values).tofile(dst)
+                self.summary.update(name, values)
+        os.replace(path.with_suffix(".tmp"), path)
+        self._files[name] = open(path, "ab")
+
+    def _numeric_values(self, column: Dict, values: pd.Series) -> np.ndarray:
+        if column["dtype"] == "int64" and not pd.api.types.is_integer_dtype(values.dtype):
+            self._promote_to_float(column)
+        return values.to_numpy(dtype=column["dtype"])
+
+    def _categorical_codes(self, column: Dict, values: pd.Series) -> np.ndarray:
+        vocabulary = self._vocabularies[column["name"]]
+        codes, uniques = pd.factorize(values.astype(object))
+        mapping = np.array([vocabulary.setdefault(str(value), len(vocabulary)) for value in uniques] + [-1],
+                           dtype=np.int32)
+        return mapping[codes]
+
+    def append(self, chunk: pd.DataFrame):
+        """Append a chunk of rows to the new dataset version."""
+        if not self._columns:
+            self._init_schema(chunk)
+        expected = [column["name"] for column in self._columns]
+        if list(chunk.columns) != expected:
+            raise ValueError(f"Expected columns {expected}, found {list(chunk.columns)}")
+
+        for column in self._columns:
+            values = chunk[column["name"]]
+            if column["kind"] == "numeric" and not _is_numeric(values.dtype):
+                if column["name"] in self.numeric_columns:
+                    raise ValueError(f"Column {column['name']!r} must be numeric, found {values.dtype} values "
+                                     f"in rows {self.rows}-{self.rows + len(values) - 1}")
+                self._demote_to_categorical(column)
+            if column["kind"] == "categorical":
+                array = self._categorical_codes(column, values)
+                self.summary.update(column["name"], values)
+            else:
+                array = self._numeric_values(column, values)
+                self.summary.update(column["name"], array)
+            array.tofile(self._files[column["name"]])
+        self.rows += len(chunk)
+        self.summary.rows += len(chunk)
+
+    def commit(self, fingerprint: str) -> Dataset:
+        """Finish the version, publish it atomically and make it the current dataset."""
+        for f in self._files.values():
+            f.close()
+
+        # Sort vocabularies so codes follow the order of the category names
+        for column in self._columns:
+            if column["kind"] != "categorical":
+                continue
+            vocabulary = self._vocabularies[column["name"]]
+            categories = sorted(vocabulary)
+            if self.rows and categories != list(vocabulary):
+                remap = np.empty(len(vocabulary) + 1, dtype=np.int32)
+                remap[[vocabulary[category] for category in categories]] = np.arange(len(categories))
+                remap[-1] = -1
+                codes = np.memmap(self.path / column["file"], dtype=np.int32, mode="r+", shape=(self.rows,))
+                codes[:] = remap[codes]
+                codes.flush()
+                del codes
+            column["categories"] = categories
+
+        manifest = {
+            "fingerprint": fingerprint,
+            "rows": self.rows,
+            "columns": self._columns,
+            "created_at": time.time(),
+        }
+        with open(self.path / "manifest.json", "w") as f:
+            json.dump(manifest, f)
+        if self._base_summary is not None:
+            self._base_summary.merge(self.summary)
+            self.summary = self._base_summary
+        self.summary.save(self.path)
+        return self.store._publish(self.path, fingerprint)
+
+    def abort(self):
+        """Discard the partially written version."""
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class CSVChunkParser:
+    """Incrementally parses a CSV byte stream into DataFrames of complete rows.
+
+    Bytes are fed as they arrive; every call returns the rows completed so far, so a file of any
+    size is parsed with memory bounded by the size of the blocks fed in.
+    """
+
+    def __init__(self, required_columns: Sequence[str] = ()):
+        self.required_columns = list(required_columns)
+        self.header: Optional[List[str]] = None
+        self.rows = 0
+        self._buffer = b""
+
+    def feed(self, block: bytes) -> Optional[pd.DataFrame]:
+        """Add a block of bytes and return the complete rows it finishes, if any."""
+        self._buffer += block
+        if self.header is None and not self._read_header():
+            return None
+
+        end = self._last_row_end()
+        if end <= 0:
+            return None
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return self._parse(data)
+
+    def close(self) -> Optional[pd.DataFrame]:
+        """Return the rows left in the buffer at the end of the stream."""
+        if self.header is None:
+            if not self._buffer.strip():
+                raise ValueError("The uploaded file is empty")
+            self._read_header(final=True)
+        data, self._buffer = self._buffer, b""
+        return self._parse(data) if data.strip() else None
+
+    def _read_header(self, final: bool = False) -> bool:
+        end = self._buffer.find(b"\n")
+        if end < 0 and not final:
+            return False
+        end = len(self._buffer) if end < 0 else end + 1
+        self.header = pd.read_csv(io.BytesIO(self._buffer[:end]), nrows=0).columns.tolist()
+        self._buffer = self._buffer[end:]
+
+        missing_columns = [col for col in self.required_columns if col not in self.header]
+        if missing_columns:
+            raise ValueError(f"Missing required columns: {missing_columns}")
+        return True
+
+    def _last_row_end(self) -> int:
+        """Offset just past the last newline that is not inside a quoted field, or 0."""
+        end = self._buffer.rfind(b"\n")
+        while end >= 0:
+            if self._buffer.count(b'"', 0, end) % 2 == 0:
+                return end + 1
+            end = self._buffer.rfind(b"\n", 0, end)
+        return 0
+
+    def _parse(self, data: bytes) -> pd.DataFrame:
+        chunk = pd.read_csv(io.BytesIO(data), header=None, names=self.header)
+        chunk.index = pd.RangeIndex(self.rows, self.rows + len(chunk))
+        self.rows += len(chunk)
+        return chunk
+
+
+class ColumnStore:
+    """Versioned on-disk store of the customer data in a typed columnar layout.
+
+    Each version lives in a directory named after the fingerprint of its source data, and a
+    CURRENT file names the version in use. Versions are written to a temporary directory and
+    renamed into place, so readers never see a partial version, and worker processes sharing
+    the store pick up a new version on their next read of CURRENT.
+    """
+
+    def __init__(self, root: Path, keep_versions: int = 3):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.keep_versions = keep_versions
+        self._datasets: Dict[str, Dataset] = {}
+        # Serializes publishing across threads and worker processes
+        self._lock = FileLock(self.root / "publish.lock")
+
+    def writer(self, numeric_columns: Sequence[str] = (), base: Optional[Dataset] = None) -> ColumnWriter:
+        return ColumnWriter(self, numeric_columns, base)
+
+    def current(self) -> Optional[Dataset]:
+        """Return the current dataset version, or None if nothing has been ingested yet."""
+        try:
+            version = (self.root / "CURRENT").read_text().strip()
+        except FileNotFoundError:
+            return None
+        dataset = self._datasets.get(version)
+        if dataset is None:
+            dataset = Dataset(self.root / version)
+            self._datasets = {version: dataset}
+        return dataset
+
+    def ingest_csv(self, csv_path: Path, numeric_columns: Sequence[str] = (),
+                   chunk_rows: int = CHUNK_ROWS) -> Dataset:
+        """Convert a CSV file into a new current dataset version, one chunk at a time.
+
+        Only numeric_columns must be numeric in every chunk; see ColumnWriter.
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        with open(csv_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint = digest.hexdigest()
+
+        if (self.root / fingerprint / "manifest.json").exists():
+            return self._set_current(fingerprint)
+
+        writer = self.writer(numeric_columns)
+        try:
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+                writer.append(chunk)
+            return writer.commit(fingerprint)
+        except Exception:
+            writer.abort()
+            raise
+
+    def _publish(self, path: Path, fingerprint: str) -> Dataset:
+        with self._lock:
+            target = self.root / fingerprint
+            if target.exists():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.rename(path, target)
+            dataset = self._set_current(fingerprint)
+            self._remove_old_versions()
+        logger.info(f"Published dataset {fingerprint} with {dataset.num_rows} rows")
+        return dataset
+
+    def _set_current(self, fingerprint: str) -> Dataset:
+        tmp = self.root / f"CURRENT.{uuid.uuid4().hex}"
+        tmp.write_text(fingerprint)
+        os.replace(tmp, self.root / "CURRENT")
+        return self.current()
+
+    def _remove_old_versions(self):
+        current = self.current()
+        versions = [p for p in self.root.iterdir()
+                    if p.is_dir() and not p.name.startswith("tmp-") and p.name != current.fingerprint]
+        versions.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+        for path in versions[self.keep_versions - 1:]:
+            shutil.rmtree(path, ignore_errors=True)
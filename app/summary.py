@@ -0,0 +1,225 @@
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """Mergeable approximate quantile sketch: a KLL-style stack of compactors.
+
+    Level h holds items of weight 2**h. When a level grows past its capacity it is sorted and
+    every other item, from a random offset, is promoted to the next level. While everything
+    still fits in level 0 the sketch is exact.
+    """
+
+    def __init__(self, capacity: int = 1024, seed: int = 0):
+        self.capacity = capacity
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def exact(self) -> bool:
+        return len(self.levels) == 1
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        self.levels[0] = np.concatenate([self.levels[0], values[~np.isnan(values)]])
+        self._compress()
+
+    def merge(self, other: "QuantileSketch"):
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self._compress()
+
+    def _compress(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.capacity:
+                level = np.sort(level)
+                keep = level[:0]
+                if len(level) % 2:
+                    i = self._rng.integers(len(level))
+                    keep, level = level[i:i + 1], np.delete(level, i)
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h] = keep
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], level[self._rng.integers(2)::2]])
+            h += 1
+
+    def quantile(self, q: float) -> float:
+        if self.exact:
+            return float(np.quantile(self.levels[0], q)) if len(self.levels[0]) else math.nan
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(values)
+        cumulative = np.cumsum(weights[order])
+        i = np.searchsorted(cumulative, q * cumulative[-1])
+        return float(values[order][min(i, len(values) - 1)])
+
+
+class NumericSummary:
+    """Running count, mean, variance, min, max and quantile sketch of a numeric column."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def update(self, values: np.ndarray):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return
+        other = NumericSummary()
+        other.count = len(values)
+        other.mean = float(values.mean())
+        other.m2 = float(((values - other.mean) ** 2).sum())
+        other.min = float(values.min())
+        other.max = float(values.max())
+        self._merge_moments(other)
+        self.sketch.update(values)
+
+    def merge(self, other: "NumericSummary"):
+        self._merge_moments(other)
+        self.sketch.merge(other.sketch)
+
+    def _merge_moments(self, other: "NumericSummary"):
+        # Parallel variance update (Chan et al.)
+        count = self.count + other.count
+        if not count:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "mean": self.mean if self.count else math.nan,
+            "median": self.sketch.quantile(0.5),
+            "std": math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan,
+            "min": self.min if self.count else math.nan,
+            "max": self.max if self.count else math.nan,
+            "quartiles": {
+                "25%": self.sketch.quantile(0.25),
+                "75%": self.sketch.quantile(0.75)
+            }
+        }
+
+
+class CategoricalSummary:
+    """Value counts of a categorical column."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = {}
+        self.nulls = 0
+
+    def update(self, values: pd.Series):
+        for value, count in values.value_counts().items():
+            if count:
+                self.counts[str(value)] = self.counts.get(str(value), 0) + int(count)
+        self.nulls += int(values.isna().sum())
+
+    def merge(self, other: "CategoricalSummary"):
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        self.nulls += other.nulls
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "value_counts": dict(sorted(self.counts.items(), key=lambda item: -item[1])),
+            "unique_values": len(self.counts) + (1 if self.nulls else 0)
+        }
+
+
+class DatasetSummary:
+    """Summary statistics of a dataset that are updated chunk by chunk and merged across appends."""
+
+    def __init__(self, columns: List[Tuple[str, str]]):
+        self.rows = 0
+        self.columns = columns
+        self.stats = {name: NumericSummary() if kind == "numeric" else CategoricalSummary()
+                      for name, kind in columns}
+
+    def update(self, name: str, values):
+        """Add a chunk of values of one column."""
+        self.stats[name].update(values)
+
+    def reset_column(self, name: str, kind: str):
+        """Change the kind of a column and clear its statistics, e.g. when it turns out not to be numeric."""
+        self.columns = [(column, kind if column == name else column_kind) for column, column_kind in self.columns]
+        self.stats[name] = NumericSummary() if kind == "numeric" else CategoricalSummary()
+
+    def merge(self, other: "DatasetSummary"):
+        """Add the statistics of another summary of the same columns, e.g. of appended rows."""
+        self.rows += other.rows
+        for name, stats in other.stats.items():
+            self.stats[name].merge(stats)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_customers": self.rows,
+            "columns": [name for name, _ in self.columns],
+            "numeric_columns_summary": {
+                name: self.stats[name].to_dict() for name, kind in self.columns if kind == "numeric"
+            },
+            "categorical_columns_summary": {
+                name: self.stats[name].to_dict() for name, kind in self.columns if kind == "categorical"
+            }
+        }
+
+    def save(self, path: Path):
+        """Write the mergeable state next to a dataset version."""
+        state = {
+            "rows": self.rows,
+            "columns": self.columns,
+            "numeric": {name: {"count": s.count, "mean": s.mean, "m2": s.m2, "min": s.min, "max": s.max}
+                        for name, s in self.stats.items() if isinstance(s, NumericSummary)},
+            "categorical": {name: {"counts": s.counts, "nulls": s.nulls}
+                            for name, s in self.stats.items() if isinstance(s, CategoricalSummary)},
+        }
+        with open(path / "summary.json", "w") as f:
+            json.dump(state, f)
+        np.savez(path / "summary_sketches.npz", **{
+            f"{i}/{h}": level
+            for i, (name, _) in enumerate(self.columns) if isinstance(self.stats[name], NumericSummary)
+            for h, level in enumerate(self.stats[name].sketch.levels)
+        })
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["DatasetSummary"]:
+        """Load the mergeable state saved with a dataset version, if there is one."""
+        try:
+            with open(path / "summary.json") as f:
+                state = json.load(f)
+            with np.load(path / "summary_sketches.npz") as sketches:
+                levels = {key: sketches[key] for key in sketches.files}
+        except FileNotFoundError:
+            return None
+
+        summary = cls([tuple(column) for column in state["columns"]])
+        summary.rows = state["rows"]
+        for name, values in state["numeric"].items():
+            stats = summary.stats[name]
+            stats.count, stats.mean, stats.m2 = values["count"], values["mean"], values["m2"]
+            stats.min, stats.max = values["min"], values["max"]
+        for name, values in state["categorical"].items():
+            summary.stats[name].counts = values["counts"]
+            summary.stats[name].nulls = values["nulls"]
+        for i, (name, kind) in enumerate(summary.columns):
+            if kind == "numeric":
+                column_levels = sorted((int(key.split("/")[1]), level) for key, level in levels.items()
+                                       if key.split("/")[0] == str(i))
+                summary.stats[name].sketch.levels = [level for _, level in column_levels] or [np.empty(0)]
+        return summary
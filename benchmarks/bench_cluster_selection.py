@@ -0,0 +1,108 @@
+"""Benchmark the cluster count search of CustomerSegmentation.
+
+Each (strategy, size) case runs in a fresh process so peak RSS is measured per case.
+
+    python -m benchmarks.bench_cluster_selection --rows 10000 100000 1000000
+"""
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+
+from app.models.backends import get_backend
+from app.models.segmentation import CustomerSegmentation
+from benchmarks.processes import collect
+from benchmarks.synthetic import generate_customers
+
+STRATEGIES = {
+    'exact': dict(algorithm='kmeans', silhouette_sample_size=None),
+    'sampled': dict(algorithm='kmeans', silhouette_sample_size=10000),
+    'sampled-warm': dict(algorithm='kmeans', silhouette_sample_size=10000, warm_start=True),
+    'minibatch': dict(algorithm='minibatch', silhouette_sample_size=10000),
+    'minibatch-warm': dict(algorithm='minibatch', silhouette_sample_size=10000, warm_start=True),
+    'kmedoids': dict(algorithm='kmedoids', silhouette_sample_size=10000),
+}
+
+# Exact silhouette needs an n x n distance computation, which is impractical beyond this size
+EXACT_MAX_ROWS = 50000
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_case(strategy: str, n_rows: int, queue: multiprocessing.Queue):
+    df = generate_customers(n_rows)
+    segmentation = CustomerSegmentation(**STRATEGIES[strategy])
+    X = segmentation.preprocess_data(df)
+    rss_before = _peak_rss_mb()
+
+    start = time.perf_counter()
+    n_clusters = segmentation._determine_optimal_clusters(X)
+    elapsed = time.perf_counter() - start
+
+    queue.put({
+        'strategy': strategy,
+        'rows': n_rows,
+        'n_clusters': n_clusters,
+        'silhouette_score': segmentation._silhouette,
+        'wall_time_s': round(elapsed, 3),
+        'fit_time_s': round(sum(r['seconds'] for r in segmentation.timings.records if r['stage'] == 'fit'), 3),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'peak_rss_before_search_mb': round(rss_before, 1),
+    })
+
+
+def run(rows, strategies):
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for n_rows in rows:
+        for strategy in strategies:
+            if strategy == 'exact' and n_rows > EXACT_MAX_ROWS:
+                results.append({'strategy': strategy, 'rows': n_rows, 'skipped': True})
+                continue
+            try:
+                get_backend(STRATEGIES[strategy]['algorithm']).check_available()
+            except ValueError:
+                results.append({'strategy': strategy, 'rows': n_rows, 'skipped': True})
+                continue
+            queue = ctx.Queue()
+            process = ctx.Process(target=_run_case, args=(strategy, n_rows, queue))
+            process.start()
+            try:
+                results.append(collect(process, queue))
+            except RuntimeError as e:
+                # e.g. killed for running out of memory; the remaining cases still run
+                results.append({'strategy': strategy, 'rows': n_rows, 'error': str(e)})
+            process.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--strategies', nargs='+', choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.rows, args.strategies)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'strategy':<16}{'rows':>10}{'k':>4}{'silhouette':>12}{'wall (s)':>10}{'fit (s)':>10}{'peak RSS (MB)':>15}")
+    for result in results:
+        if result.get('skipped'):
+            print(f"{result['strategy']:<16}{result['rows']:>10}{'skipped':>51}")
+            continue
+        if result.get('error'):
+            print(f"{result['strategy']:<16}{result['rows']:>10}  {result['error']}")
+            continue
+        print(f"{result['strategy']:<16}{result['rows']:>10}{result['n_clusters']:>4}"
+              f"{result['silhouette_score']:>12.4f}{result['wall_time_s']:>10.2f}{result['fit_time_s']:>10.2f}"
+              f"{result['peak_rss_mb']:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Benchmark the segmentation hot paths and the API routes, reporting JSON for regression tracking.
+
+Each function benchmark runs in a fresh process so peak RSS is measured per case; the API load
+test runs every route through an in-process test client against a temporary data directory.
+
+    python -m benchmarks.bench_hot_paths --rows 10000 100000 1000000 --output results.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import sklearn
+
+from app.models.segmentation import CustomerSegmentation
+from benchmarks.processes import collect
+from benchmarks.synthetic import generate_customers
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+FUNCTIONS = ['preprocess_data', 'determine_optimal_clusters', 'segment_customers', 'predict_segment']
+
+# The predict_segment model is fitted on at most this many rows; scoring cost does not depend on it
+PREDICT_FIT_MAX_ROWS = 100000
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_stats(latencies: List[float], rows_per_call: int = 1) -> Dict[str, float]:
+    """Latency percentiles in milliseconds and throughput of a list of call durations in seconds."""
+    latencies_ms = np.asarray(latencies) * 1000
+    total = float(np.sum(latencies))
+    return {
+        'calls': len(latencies),
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'p50_ms': round(float(np.percentile(latencies_ms, 50)), 3),
+        'p90_ms': round(float(np.percentile(latencies_ms, 90)), 3),
+        'p99_ms': round(float(np.percentile(latencies_ms, 99)), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+        'calls_per_s': round(len(latencies) / total, 2) if total else None,
+        'rows_per_s': round(len(latencies) * rows_per_call / total, 1) if total else None,
+    }
+
+
+def measure(fn: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    """Time repeat calls of fn, then trace the allocations of one more call."""
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'latencies': latencies, 'peak_traced_mb': round(peak / 2 ** 20, 1)}
+
+
+def _function_case(name: str, df: pd.DataFrame, repeat: int):
+    """Return the latencies and peak allocations of one segmentation function on df."""
+    if name == 'preprocess_data':
+        return measure(lambda: CustomerSegmentation().preprocess_data(df), repeat), len(df)
+
+    if name == 'determine_optimal_clusters':
+        segmentation = CustomerSegmentation()
+        X = segmentation.preprocess_data(df)
+        return measure(lambda: segmentation._determine_optimal_clusters(X), repeat), len(df)
+
+    if name == 'segment_customers':
+        return measure(lambda: CustomerSegmentation().segment_customers(df), repeat), len(df)
+
+    if name == 'predict_segment':
+        segmentation = CustomerSegmentation()
+        segmentation.segment_customers(df.head(PREDICT_FIT_MAX_ROWS))
+        customers = generate_customers(1000, seed=7).to_dict('records')
+        calls = iter(customers * (repeat // len(customers) + 2))
+        return measure(lambda: segmentation.predict_segment(next(calls)), repeat), 1
+
+    raise ValueError(f"Unknown function {name!r}")
+
+
+def _run_function_case(name: str, n_rows: int, repeat: int, queue: multiprocessing.Queue):
+    df = generate_customers(n_rows)
+    rss_before = _peak_rss_mb()
+    result, rows_per_call = _function_case(name, df, repeat)
+    queue.put({
+        'function': name,
+        'rows': n_rows,
+        **latency_stats(result['latencies'], rows_per_call),
+        'peak_traced_mb': result['peak_traced_mb'],
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'peak_rss_before_mb': round(rss_before, 1),
+    })
+
+
+def run_functions(rows: List[int], functions: List[str], repeat: int,
+                  predict_calls: int) -> List[Dict]:
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for n_rows in rows:
+        for name in functions:
+            queue = ctx.Queue()
+            calls = predict_calls if name == 'predict_segment' else repeat
+            process = ctx.Process(target=_run_function_case, args=(name, n_rows, calls, queue))
+            process.start()
+            results.append(collect(process, queue))
+            process.join()
+    return results
+
+
+def _load_route(client, method: str, path: str, requests: int, name: Optional[str] = None, **kwargs) -> Dict:
+    """Send requests to one route in sequence. name labels routes with ids in their path."""
+    latencies = []
+    statuses = set()
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = client.request(method, path, **kwargs)
+        response.read()
+        latencies.append(time.perf_counter() - start)
+        statuses.add(response.status_code)
+    return {'route': name or f"{method} {path}", **latency_stats(latencies),
+            'status_codes': sorted(statuses), 'peak_rss_mb': round(_peak_rss_mb(), 1)}
+
+
+def _run_api(n_rows: int, requests: int, batch_rows: int, queue: multiprocessing.Queue):
+    # The app resolves data/, models/ and app/static relative to the working directory
+    workdir = Path(tempfile.mkdtemp(prefix='bench-api-'))
+    (workdir / 'app').symlink_to(REPO_ROOT / 'app')
+    os.chdir(workdir)
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    csv = generate_customers(n_rows).to_csv(index=False).encode()
+    batch = generate_customers(batch_rows, seed=7)
+    customer = batch.iloc[0].to_dict()
+    customer = {k: v.item() if isinstance(v, np.generic) else v for k, v in customer.items()}
+    delta = generate_customers(max(n_rows // 100, 1), seed=11, start_id=n_rows + 1).to_csv(index=False).encode()
+
+    results = []
+    # Server errors are reported in status_codes instead of aborting the run
+    with TestClient(app, raise_server_exceptions=False) as client:
+        results.append(_load_route(client, 'POST', '/upload-data/', 1,
+                                   files={'file': ('customers.csv', csv, 'text/csv')}))
+        results[-1]['rows'] = n_rows
+        results.append(_load_route(client, 'POST', '/segment-customers/', 1, name='POST /segment-customers/ (cold)'))
+        results.append(_load_route(client, 'GET', '/', requests))
+        results.append(_load_route(client, 'GET', '/health', requests))
+        results.append(_load_route(client, 'GET', '/data-summary/', requests))
+        results.append(_load_route(client, 'POST', '/segment-customers/', requests))
+        results.append(_load_route(client, 'POST', '/segmentation-jobs/', requests))
+        job_id = client.post('/segmentation-jobs/').json()['job_id']
+        results.append(_load_route(client, 'GET', f'/segmentation-jobs/{job_id}', requests,
+                                   name='GET /segmentation-jobs/{job_id}'))
+        results.append(_load_route(client, 'POST', '/predict-segment/', requests, json=customer))
+        batch_route = _load_route(client, 'POST', '/predict-segments/', requests,
+                                  content=batch.to_csv(index=False).encode(), headers={'content-type': 'text/csv'})
+        batch_route['rows'] = batch_rows
+        results.append(batch_route)
+        results.append(_load_route(client, 'GET', '/segment-analysis/', requests))
+        results.append(_load_route(client, 'GET', '/customers/?segment=0&min_income=50000&page=2', requests,
+                                   name='GET /customers/'))
+        results.append(_load_route(client, 'POST', '/append-data/', 1,
+                                   files={'file': ('delta.csv', delta, 'text/csv')}))
+    queue.put(results)
+
+
+def run_api(n_rows: int, requests: int, batch_rows: int) -> List[Dict]:
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_run_api, args=(n_rows, requests, batch_rows, queue))
+    process.start()
+    results = collect(process, queue)
+    process.join()
+    return results
+
+
+def environment() -> Dict[str, Any]:
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'scikit-learn': sklearn.__version__,
+        'timestamp': time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--functions', nargs='+', choices=FUNCTIONS, default=FUNCTIONS)
+    parser.add_argument('--repeat', type=int, default=3, help='timed calls per function benchmark')
+    parser.add_argument('--predict-calls', type=int, default=1000, help='timed calls of predict_segment')
+    parser.add_argument('--api-rows', type=int, default=10000, help='rows uploaded for the API load test')
+    parser.add_argument('--api-requests', type=int, default=50, help='requests per route')
+    parser.add_argument('--batch-rows', type=int, default=1000, help='customers per /predict-segments/ request')
+    parser.add_argument('--skip-functions', action='store_true')
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--output', type=Path, help='write the JSON report to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = {'environment': environment(), 'functions': [], 'api': []}
+    if not args.skip_functions:
+        report['functions'] = run_functions(args.rows, args.functions, args.repeat, args.predict_calls)
+    if not args.skip_api:
+        report['api'] = run_api(args.api_rows, args.api_requests, args.batch_rows)
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark batch assignment of customers to fitted centers as the number of segments grows.
+
+Compares the exact blocked search of CentroidIndex with the approximate search for several
+numbers of probed groups, reporting throughput and how often each assignment matches the exact one.
+
+    python -m benchmarks.bench_scoring --rows 1000000 --clusters 8 64 256 1024 4096
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from app.models.scoring import CentroidIndex
+from app.models.segmentation import CustomerSegmentation
+from benchmarks.synthetic import generate_customers
+
+# Centers are fitted on at most this many rows; scoring cost does not depend on it
+FIT_MAX_ROWS = 100000
+
+
+def _timed_query(index: CentroidIndex, X: np.ndarray, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        labels = index.query(X)
+        latencies.append(time.perf_counter() - start)
+    return labels, min(latencies)
+
+
+def run(n_rows: int, clusters: List[int], probes: List[Optional[int]], repeat: int) -> List[Dict]:
+    X = CustomerSegmentation().preprocess_data(generate_customers(n_rows))
+    results = []
+    for n_clusters in clusters:
+        centers = MiniBatchKMeans(n_clusters=n_clusters, n_init=1, max_iter=20, batch_size=16384,
+                                  random_state=0).fit(X[:FIT_MAX_ROWS]).cluster_centers_
+        exact_labels = None
+        for n_probe in probes:
+            start = time.perf_counter()
+            index = CentroidIndex(centers, n_probe=n_probe)
+            build_time = time.perf_counter() - start
+            labels, seconds = _timed_query(index, X, repeat)
+            if n_probe is None:
+                exact_labels = labels
+            results.append({
+                'clusters': n_clusters,
+                'rows': n_rows,
+                'n_probe': n_probe,
+                'exact': index.exact,
+                'build_s': round(build_time, 4),
+                'query_s': round(seconds, 4),
+                'rows_per_s': round(n_rows / seconds, 1),
+                'agreement': round(float((labels == exact_labels).mean()), 4),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--clusters', type=int, nargs='+', default=[8, 64, 256, 1024])
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4],
+                        help='numbers of probed groups compared with the exact search')
+    parser.add_argument('--repeat', type=int, default=3, help='timed queries per case, the fastest is reported')
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.clusters, [None] + args.probes, args.repeat), indent=2))
+
+
+if __name__ == '__main__':
+    main()
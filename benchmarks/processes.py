@@ -0,0 +1,13 @@
+"""Helpers for running benchmark cases in their own processes."""
+import multiprocessing
+import queue as queue_module
+
+
+def collect(process: multiprocessing.Process, queue: multiprocessing.Queue):
+    """Wait for the result of a benchmark process, failing if it dies without one."""
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except queue_module.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Benchmark process exited with code {process.exitcode}")
@@ -0,0 +1,67 @@
+"""Synthetic customers with the schema of customer_data.csv, at any size.
+
+    python -m benchmarks.synthetic --rows 10000000 --output data/customers_10m.csv
+"""
+import argparse
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ['Electronics', 'Gaming', 'Accessories', 'Smartphones', 'Laptops']
+LOCATION_PREFIXES = ['North', 'South', 'East', 'West', 'Lake', 'New', 'Port', 'Fort']
+LOCATION_NAMES = ['Judith', 'Jill', 'Robert', 'Jesse', 'Debra', 'Robinson', 'Lisa', 'Eric', 'Noah', 'Maria']
+LOCATION_SUFFIXES = ['bury', 'town', 'ville', 'shire', 'mouth', 'stad', 'haven', 'port']
+
+
+def generate_customers(n_rows: int, seed: int = 42, start_id: int = 1) -> pd.DataFrame:
+    """Generate synthetic customers with the schema and distributions of customer_data.csv."""
+    rng = np.random.default_rng(seed)
+
+    purchase_frequency = rng.poisson(2.0, n_rows)
+    avg_order_value = np.clip(rng.normal(98.0, 29.0, n_rows), 10.0, None)
+    locations = np.array([f"{prefix} {name}{suffix}"
+                          for prefix in LOCATION_PREFIXES
+                          for name in LOCATION_NAMES
+                          for suffix in LOCATION_SUFFIXES])
+
+    return pd.DataFrame({
+        'customer_id': np.arange(start_id, start_id + n_rows),
+        'age': np.clip(rng.normal(35.0, 11.0, n_rows), 18, 81).astype(np.int64),
+        'gender': rng.choice(['M', 'F'], n_rows),
+        'income': (20000 + rng.gamma(1.2, 18000.0, n_rows)).astype(np.int64),
+        'location': rng.choice(locations, n_rows),
+        'visits_per_month': rng.poisson(4.9, n_rows),
+        'avg_time_spent': np.clip(rng.normal(30.0, 10.0, n_rows), 1.0, None),
+        'purchase_frequency': purchase_frequency,
+        'avg_order_value': avg_order_value,
+        'preferred_category': rng.choice(CATEGORIES, n_rows),
+        'customer_lifetime_value': 12 * purchase_frequency * avg_order_value + rng.normal(0.0, 50.0, n_rows),
+    })
+
+
+def iter_customers(n_rows: int, chunk_rows: int = 1000000, seed: int = 42) -> Iterator[pd.DataFrame]:
+    """Generate n_rows synthetic customers in chunks, so memory stays bounded at any size."""
+    for i, start in enumerate(range(0, n_rows, chunk_rows)):
+        yield generate_customers(min(chunk_rows, n_rows - start), seed=seed + i, start_id=start + 1)
+
+
+def write_customers_csv(path: Path, n_rows: int, chunk_rows: int = 1000000, seed: int = 42):
+    """Write n_rows synthetic customers to a CSV file, one chunk at a time."""
+    with open(path, 'w', newline='') as f:
+        for i, chunk in enumerate(iter_customers(n_rows, chunk_rows, seed)):
+            chunk.to_csv(f, header=(i == 0), index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--output', type=Path, required=True)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    write_customers_csv(args.output, args.rows, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app.storage import CSVChunkParser
+
+
+def parse_in_blocks(data: bytes, block_size: int, required_columns=()) -> pd.DataFrame:
+    """Feed data to a parser block_size bytes at a time and concatenate the rows it returns."""
+    parser = CSVChunkParser(required_columns)
+    chunks = [parser.feed(data[start:start + block_size]) for start in range(0, len(data), block_size)]
+    chunks.append(parser.close())
+    chunks = [chunk for chunk in chunks if chunk is not None]
+    result = pd.concat(chunks) if chunks else pd.DataFrame(columns=parser.header)
+    assert parser.rows == len(result)
+    assert list(result.index) == list(range(len(result)))
+    return result
+
+
+def assert_parsed_like_pandas(data: bytes, block_size: int):
+    expected = pd.read_csv(io.BytesIO(data))
+    result = parse_in_blocks(data, block_size)
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False)
+
+
+QUOTED = (b'id,name,notes\n'
+          b'1,"Smith, Ann","line one\nline two"\n'
+          b'2,Bob,"says ""hi""\nthen leaves"\n'
+          b'3,"Carol","""quoted"" start"\n'
+          b'4,Dan,\n')
+
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 5, 7, 11, 16, len(QUOTED)])
+def test_quoted_newlines_split_across_blocks(block_size):
+    assert_parsed_like_pandas(QUOTED, block_size)
+
+
+def test_quoted_newline_at_every_split_point():
+    for split in range(1, len(QUOTED)):
+        parser = CSVChunkParser()
+        chunks = [parser.feed(QUOTED[:split]), parser.feed(QUOTED[split:]), parser.close()]
+        result = pd.concat([chunk for chunk in chunks if chunk is not None])
+        assert result["notes"].tolist()[:2] == ["line one\nline two", 'says "hi"\nthen leaves'], split
+
+
+@pytest.mark.parametrize("block_size", [1, 4, 9, 1000])
+def test_crlf_line_endings(block_size):
+    data = b'id,city,value\r\n1,Paris,1.5\r\n2,"New\r\nYork",2.5\r\n3,Rome,3.5\r\n'
+    result = parse_in_blocks(data, block_size)
+    assert list(result.columns) == ["id", "city", "value"]
+    assert result["id"].tolist() == [1, 2, 3]
+    assert result["value"].tolist() == [1.5, 2.5, 3.5]
+    assert result["city"].tolist()[1] == "New\r\nYork"
+
+
+@pytest.mark.parametrize("block_size", [1, 6, 1000])
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n"])
+def test_final_row_without_trailing_newline(block_size, newline):
+    data = newline.join([b"id,value", b"1,10", b"2,20", b"3,30"])
+    result = parse_in_blocks(data, block_size)
+    assert result["id"].tolist() == [1, 2, 3]
+    assert result["value"].tolist() == [10, 20, 30]
+
+
+def test_header_over_several_blocks():
+    parser = CSVChunkParser(["customer_id", "income"])
+    assert parser.feed(b"customer_") is None
+    assert parser.feed(b"id,inc") is None
+    assert parser.header is None
+    chunk = parser.feed(b"ome\n1,100\n2,2")
+    assert parser.header == ["customer_id", "income"]
+    assert chunk["income"].tolist() == [100]
+    assert parser.close()["income"].tolist() == [2]
+
+
+def test_header_only():
+    parser = CSVChunkParser()
+    assert parser.feed(b"a,b") is None
+    assert parser.close() is None
+    assert parser.header == ["a", "b"]
+    assert parser.rows == 0
+
+
+def test_missing_required_columns():
+    parser = CSVChunkParser(["age", "income"])
+    with pytest.raises(ValueError, match=r"Missing required columns: \['income'\]"):
+        parser.feed(b"age,gender\n30,F\n")
+
+
+def test_empty_file():
+    with pytest.raises(ValueError, match="empty"):
+        CSVChunkParser().close()
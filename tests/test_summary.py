@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.summary import CategoricalSummary, DatasetSummary, NumericSummary, QuantileSketch
+
+QUANTILES = np.linspace(0.01, 0.99, 99)
+
+
+def total_weight(sketch: QuantileSketch) -> float:
+    return sum(len(level) * 2.0 ** h for h, level in enumerate(sketch.levels))
+
+
+def max_rank_error(sketch: QuantileSketch, values: np.ndarray) -> float:
+    """Largest difference between q and the true rank of the sketch's q-quantile, over QUANTILES."""
+    values = np.sort(values)
+    ranks = np.searchsorted(values, [sketch.quantile(q) for q in QUANTILES]) / len(values)
+    return float(np.max(np.abs(ranks - QUANTILES)))
+
+
+def test_sketch_is_exact_within_capacity():
+    values = np.random.default_rng(0).normal(size=1000)
+    sketch = QuantileSketch(capacity=1024)
+    sketch.update(values[:400])
+    other = QuantileSketch(capacity=1024)
+    other.update(values[400:])
+    sketch.merge(other)
+    assert sketch.exact
+    for q in (0.1, 0.25, 0.5, 0.75, 0.9):
+        assert sketch.quantile(q) == pytest.approx(np.quantile(values, q))
+
+
+def test_sketch_ignores_nan_and_empty_is_nan():
+    sketch = QuantileSketch()
+    assert np.isnan(sketch.quantile(0.5))
+    sketch.update(np.array([1.0, np.nan, 3.0]))
+    assert sketch.quantile(0.5) == 2.0
+
+
+def test_sketch_rank_error_after_merging():
+    rng = np.random.default_rng(1)
+    parts = [rng.lognormal(i % 3, 1.0, 30000) for i in range(8)]
+    sketches = []
+    for i, part in enumerate(parts):
+        sketch = QuantileSketch(capacity=1024, seed=i)
+        for chunk in np.array_split(part, 7):
+            sketch.update(chunk)
+        sketches.append(sketch)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+
+    values = np.concatenate(parts)
+    assert not merged.exact
+    # Compaction keeps the total weight, and memory stays bounded by the capacity per level
+    assert total_weight(merged) == len(values)
+    assert all(len(level) <= merged.capacity for level in merged.levels)
+    assert max_rank_error(merged, values) < 0.01
+
+
+def test_merged_sketch_matches_single_sketch_accuracy():
+    values = np.random.default_rng(2).uniform(size=200000)
+    single = QuantileSketch(seed=0)
+    single.update(values)
+    merged = QuantileSketch(seed=0)
+    for part in np.array_split(values, 10):
+        sketch = QuantileSketch(seed=1)
+        sketch.update(part)
+        merged.merge(sketch)
+    assert max_rank_error(single, values) < 0.01
+    assert max_rank_error(merged, values) < 0.01
+
+
+def test_numeric_summary_merge_matches_numpy():
+    rng = np.random.default_rng(3)
+    parts = [rng.normal(1e6, 50.0, 5000), rng.normal(1e6 + 10, 5.0, 20), rng.exponential(3.0, 70000), np.array([7.0])]
+    values = np.concatenate(parts)
+
+    merged = NumericSummary()
+    for part in parts:
+        summary = NumericSummary()
+        for chunk in np.array_split(part, 3):
+            summary.update(chunk)
+        merged.merge(summary)
+
+    stats = merged.to_dict()
+    assert merged.count == len(values)
+    assert stats["mean"] == pytest.approx(values.mean(), rel=1e-12)
+    assert stats["std"] == pytest.approx(values.std(ddof=1), rel=1e-9)
+    assert stats["min"] == values.min()
+    assert stats["max"] == values.max()
+
+
+def test_numeric_summary_skips_nan_and_empty_merges():
+    summary = NumericSummary()
+    summary.merge(NumericSummary())
+    assert np.isnan(summary.to_dict()["mean"])
+    summary.update(np.array([np.nan, np.nan]))
+    assert summary.count == 0
+    summary.update(np.array([2.0, np.nan, 4.0]))
+    summary.merge(NumericSummary())
+    assert summary.count == 2
+    assert summary.to_dict()["mean"] == 3.0
+    assert summary.to_dict()["std"] == pytest.approx(np.sqrt(2.0))
+
+
+def test_categorical_summary_merge():
+    first, second = CategoricalSummary(), CategoricalSummary()
+    first.update(pd.Series(["F", "M", "F", None]))
+    second.update(pd.Series(["M", "O", None, None]))
+    first.merge(second)
+    assert first.counts == {"F": 2, "M": 2, "O": 1}
+    assert first.nulls == 3
+    assert first.to_dict()["unique_values"] == 4
+
+
+def test_dataset_summary_save_load_and_merge(tmp_path):
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({"income": rng.lognormal(10, 1, 6000), "gender": rng.choice(["F", "M"], 6000)})
+    columns = [("income", "numeric"), ("gender", "categorical")]
+
+    def summarize(frame: pd.DataFrame) -> DatasetSummary:
+        summary = DatasetSummary(columns)
+        summary.rows = len(frame)
+        summary.update("income", frame["income"].to_numpy())
+        summary.update("gender", frame["gender"])
+        return summary
+
+    summarize(df[:4000]).save(tmp_path)
+    loaded = DatasetSummary.load(tmp_path)
+    loaded.merge(summarize(df[4000:]))
+    result = loaded.to_dict()
+
+    assert result["total_customers"] == len(df)
+    income = result["numeric_columns_summary"]["income"]
+    assert income["mean"] == pytest.approx(df["income"].mean())
+    assert income["std"] == pytest.approx(df["income"].std())
+    assert abs((df["income"] < income["median"]).mean() - 0.5) < 0.01
+    assert result["categorical_columns_summary"]["gender"]["value_counts"] == df["gender"].value_counts().to_dict()
+
+
+def test_dataset_summary_load_missing(tmp_path):
+    assert DatasetSummary.load(tmp_path) is None